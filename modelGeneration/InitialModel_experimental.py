@@ -5,24 +5,14 @@
 
 
 import sys
-import csv
+from proteinSequences import load_sequences
+from tRNASequences import tRNA_names
 
 # Get the Protein sequences
-prot_names=list()
-prot_len=list()
-sequence=list()
-
-f = open('ProtSeq.csv', 'rt')
-
-reader = csv.reader(f)
-your_list = list(reader)
-
-for i in range(1,len(your_list)): #skip the first one
-    prot_names = prot_names+[your_list[i][0]]
-    prot_len   = prot_len+[your_list[i][1]]
-    sequence   = sequence+[your_list[i][2]]
-
-f.close()
+proteins   = load_sequences()
+prot_names = proteins.names
+prot_len   = proteins.lengths
+sequence   = proteins.strings()
 
 # Get the AA to trna associations
 SingleAA = {
@@ -296,14 +286,11 @@ def create_model(names,lengthsofseq,sequenceAAs):
     #create the #AA positions
     for p in range(int(lengthsofseq[n])):
 
-      if isinstance(SingleAA[sequence[n][p]],basestring):
-          riboPos_Elongation(model ,names[n] + '_p' + str(p),sequence[n][p],SingleAA[sequence[n][p]],1)
-      else:
-          i=1
-          for id in SingleAA[sequence[n][p]]:
-          #riboPos_Elongation(model,startingPos             ,AAadded       ,tRNA_needed,iterator):
-            riboPos_Elongation(model ,names[n] + '_p' + str(p),sequence[n][p],id         ,i)
-            i=i+1
+      i=1
+      for id in tRNA_names(SingleAA[sequence[n][p]]):
+      #riboPos_Elongation(model,startingPos             ,AAadded       ,tRNA_needed,iterator):
+        riboPos_Elongation(model ,names[n] + '_p' + str(p),sequence[n][p],id         ,i)
+        i=i+1
 
 
   # Termination
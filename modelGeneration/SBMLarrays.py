@@ -0,0 +1,76 @@
+#################################
+# SBML "arrays" package markup
+#################################
+
+# The libSBML builds we use are compiled without the (experimental) arrays
+# package, so arrayed elements are written as text: the core element is
+# still built with libSBML and serialised with toSBML(), and the functions
+# below add the arrays:listOfDimensions / arrays:listOfIndices children and
+# the MathML <vector> and <selector> constructs from the arrays proposal
+# (take2/arrays-proposal-sept2013.pdf).
+
+import re
+
+ARRAYS_NS = 'http://www.sbml.org/sbml/level3/version1/arrays/version1'
+MATHML_NS = 'http://www.w3.org/1998/Math/MathML'
+
+
+def cn(value):
+    return '<cn type="integer"> ' + str(value) + ' </cn>'
+
+
+def ci(name):
+    return '<ci> ' + name + ' </ci>'
+
+
+def selector(array, index):
+    """MathML for array[index]; both arguments are MathML strings."""
+    return '<apply><selector/>' + array + index + '</apply>'
+
+
+def plus(a, b):
+    return '<apply><plus/>' + a + b + '</apply>'
+
+
+def add_dimensions(xml, dimensions):
+    """Adds an arrays:listOfDimensions to the top element of 'xml'.
+    'dimensions' is a list of (dimension id, size parameter id), the first
+    one being arrayDimension 0."""
+    text = '<arrays:listOfDimensions>'
+    for i in range(len(dimensions)):
+        text += '<arrays:dimension arrays:id="' + dimensions[i][0] + '" arrays:size="' \
+                + dimensions[i][1] + '" arrays:arrayDimension="' + str(i) + '"/>'
+    text += '</arrays:listOfDimensions>'
+    return _add_child(xml, text)
+
+
+def index_species(xml, species, array, index):
+    """Replaces every reference to the scalar 'species' in the reaction
+    'xml' (species references and <ci> in the kinetic law) by the element
+    'index' (a MathML string) of the arrayed species 'array'."""
+    indices = '<arrays:listOfIndices><arrays:index arrays:referencedAttribute="species" ' \
+              'arrays:arrayDimension="0"><math xmlns="' + MATHML_NS + '">' + index + \
+              '</math></arrays:index></arrays:listOfIndices>'
+    xml = re.sub('<speciesReference species="' + re.escape(species) + '"([^>]*)/>',
+                 lambda m: '<speciesReference species="' + array + '"' + m.group(1) + '>' +
+                 indices + '</speciesReference>', xml)
+    return xml.replace(ci(species), selector(ci(array), index))
+
+
+def vector_assignment(symbol, values):
+    """An initialAssignment setting the arrayed parameter 'symbol' to the
+    integer vector 'values'."""
+    return '<initialAssignment symbol="' + symbol + '">\n' + \
+           '  <math xmlns="' + MATHML_NS + '">\n' + \
+           '    <vector>' + ''.join(cn(v) for v in values) + '</vector>\n' + \
+           '  </math>\n' + \
+           '</initialAssignment>'
+
+
+def _add_child(xml, child):
+    first = xml.index('>')
+    if xml[first - 1] == '/':
+        tag = xml[1:].split(None, 1)[0]
+        return xml[:first - 1] + '>' + child + '</' + tag + '>' + xml[first + 1:]
+    last = xml.rindex('</')
+    return xml[:last] + '  ' + child + '\n' + xml[last:]
@@ -0,0 +1,121 @@
+#################################
+# Incremental SBML writer
+#################################
+
+# libSBML keeps every species and reaction of a document in memory until
+# writeSBMLToFile is called, which is what makes the full translation model
+# (hundreds of thousands of elongation reactions) impossible to generate on a
+# normal machine.  SBMLStreamWriter writes the model in pieces instead: the
+# generator builds a few elements in a scratch model, hands the ListOf to
+# write(), and the elements are serialised to disk and deleted again.
+
+from libsbml import writeSBMLToString
+
+# order of the ListOf elements inside an SBML Level 3 Version 1 <model>
+SECTION_ORDER = ['listOfFunctionDefinitions', 'listOfUnitDefinitions',
+                 'listOfCompartments', 'listOfSpecies', 'listOfParameters',
+                 'listOfInitialAssignments', 'listOfRules', 'listOfConstraints',
+                 'listOfReactions', 'listOfEvents']
+
+
+class SBMLStreamWriter(object):
+    """Writes an SBML document to 'filename' one ListOf at a time.
+
+    'document' supplies everything that is written up front: the <sbml> and
+    <model> attributes and any small lists already in it (units,
+    compartments).  Sections must be written in SBML order; an empty section
+    is never opened, so no empty <listOf...> element ends up in the file.
+    'packages' lists (prefix, namespace) of required SBML packages whose
+    markup libSBML cannot produce itself and that are added with write_xml.
+    With 'ids' (a compactIds.CompactIds) every element is written with
+    compact identifiers.
+    """
+
+    def __init__(self, document, filename, indent='  ', packages=(), ids=None):
+        text = writeSBMLToString(document)
+        for prefix, uri in packages:
+            text = text.replace('<sbml ', '<sbml xmlns:' + prefix + '="' + uri + '" ' +
+                                prefix + ':required="true" ', 1)
+        cut = text.rfind('</model>')
+        if cut < 0:
+            raise ValueError('document passed to SBMLStreamWriter needs a model with at least one compartment')
+        cut = text.rfind('\n', 0, cut) + 1
+        header = text[:cut]
+        self.footer = text[cut:]
+        self.indent = indent
+        self.ids = ids
+        self.section = None
+        self.counts = {}
+        # sections already present in the document cannot be reopened
+        self.done = [name for name in SECTION_ORDER if '<' + name + '>' in header]
+        self.f = open(filename, 'wt')
+        self.f.write(header)
+
+    def write(self, elements):
+        """Serialises every element of the libSBML ListOf 'elements' and
+        then removes them from it, so the scratch model can be reused."""
+        if elements.size() == 0:
+            return
+        name = elements.getElementName()
+        if name != self.section:
+            self._open(name)
+        pad = self.indent * 3
+        for i in range(elements.size()):
+            text = elements.get(i).toSBML()
+            if self.ids is not None:
+                text = self.ids.rewrite(text)
+            self.f.write(pad + text.replace('\n', '\n' + pad) + '\n')
+        self.counts[name] = self.counts.get(name, 0) + elements.size()
+        elements.clear()
+
+    def write_xml(self, section, text):
+        """Writes one element that is already serialised to 'text'."""
+        if section != self.section:
+            self._open(section)
+        pad = self.indent * 3
+        if self.ids is not None:
+            text = self.ids.rewrite(text)
+        self.f.write(pad + text.replace('\n', '\n' + pad) + '\n')
+        self.counts[section] = self.counts.get(section, 0) + 1
+
+    def close(self):
+        """Finishes the document and closes the file.  Returns 1 like
+        writeSBMLToFile does on success."""
+        self._end()
+        self.f.write(self.footer)
+        self.f.close()
+        return 1
+
+    def _open(self, name):
+        if name not in SECTION_ORDER:
+            raise ValueError('unknown SBML model section ' + name)
+        if name in self.done or (self.section is not None and
+                                 SECTION_ORDER.index(name) < SECTION_ORDER.index(self.section)):
+            raise ValueError(name + ' written out of order; SBML sections must be streamed in document order')
+        self._end()
+        self.f.write(self.indent * 2 + '<' + name + '>\n')
+        self.section = name
+
+    def _end(self):
+        if self.section is not None:
+            self.f.write(self.indent * 2 + '</' + self.section + '>\n')
+            self.done.append(self.section)
+            self.section = None
+
+
+class SBMLFragmentCollector(object):
+    """Stands in for SBMLStreamWriter where elements are built in another
+    process: keeps the serialised elements as a list of (section, xml) to
+    be passed to SBMLStreamWriter.write_xml by the parent."""
+
+    def __init__(self):
+        self.fragments = []
+
+    def write(self, elements):
+        name = elements.getElementName()
+        for i in range(elements.size()):
+            self.fragments.append((name, elements.get(i).toSBML()))
+        elements.clear()
+
+    def write_xml(self, section, text):
+        self.fragments.append((section, text))
@@ -3,40 +3,21 @@
 # Initialization Block
 #################################
 
-# Get the Protein sequences
+# Get the Protein sequences and RNA names from the knowledge base
+# (memory-mapped from knowledgebase.xlsx.snapshot after the first run)
+import os
 import sys
-import csv
+from extractKnowledgebase import load_knowledgebase
 
 
-#load  proteins from csv
-prot_names=[]
-prot_len=[]
-sequence=[]
+kb         = load_knowledgebase()
+proteins   = kb.proteins
+prot_names = proteins.names
+prot_len   = proteins.lengths
+sequence   = proteins.strings('Z')
 
-
-
-f = open('ProtSeq.csv', 'rt')
-
-reader = csv.reader(f)
-your_list = list(reader)
-
-for i in range(1,len(your_list)): #skip the first one
-    prot_names = prot_names+[your_list[i][0]]
-    prot_len   = prot_len+[your_list[i][1]]
-    sequence   = sequence+['Z'+(your_list[i][2])[1:]]
-
-f.close()
-
-#load RNA names from csv
-mRNAnames=[]
-
-f = open('Molecules_names_RNAs_Translation.csv', 'rt')
-reader = csv.reader(f)
-your_list = list(reader)
-for i in range(1,len(your_list)): #skip the first one
-    #mRNA_one_name=your_list[i][0]
-    mRNAnames = mRNAnames + [your_list[i][0]]
-f.close()
+#RNA names (mRNAs, tRNAs, rRNAs, sRNAs)
+mRNAnames  = kb.rna_names
 
 
 
@@ -67,11 +48,25 @@ SingleAA = {
 }
 
 
+# amino acids per second, for the delayed elongation of reduced models
+ELONGATION_RATE = 16
+
+
 ########################################################
 ## Define reactions and preliminaries
 #######################################################
     
 from libsbml import *
+from SBMLstreamWriter import SBMLStreamWriter, SBMLFragmentCollector
+from compactIds import CompactIds
+from fragmentCache import FragmentCache
+from proteinSequences import file_hash
+import tRNASequences
+import SBMLarrays
+import SBMLstreamWriter
+import compactIds
+from tRNASequences import ROTATE, encode, tRNA_names
+from SBMLarrays import ARRAYS_NS, add_dimensions, index_species, vector_assignment, selector, plus, ci, cn
 
 def create_species(model, var_name,initialAmount=0):
   s1 = model.createSpecies()
@@ -85,7 +80,55 @@ def create_species(model, var_name,initialAmount=0):
   check(s1.setBoundaryCondition(False),     'set "boundaryCondition" on s1')
   check(s1.setHasOnlySubstanceUnits(True), 'set "hasOnlySubstanceUnits" on s1')
 
-def riboPos_Elongation(model,startingPos,AAadded,tRNA_needed,iterator):
+def create_index_parameter(model, var_name, value=None):
+  # integer valued constant parameter, e.g. an array size for the arrays package
+  p1 = model.createParameter()
+  check(p1,                                 'create parameter p1')
+  check(p1.setId(var_name),                 'set parameter p1 id')
+  check(p1.setConstant(True),               'set parameter p1 "constant"')
+  check(p1.setUnits('dimensionless'),       'set parameter p1 units')
+  if value is not None:
+    check(p1.setValue(value),               'set parameter p1 value')
+
+def elongation_tRNAs(AA, pooled=False):
+  # tRNAs an elongation step adding AA can use; with pooled=True amino acids
+  # with synonymous tRNAs use the lumped pool_<AA> instead
+  tRNAs = tRNA_names(SingleAA[AA])
+  if pooled and len(tRNAs) > 1:
+    return ['pool_' + AA]
+  return tRNAs
+
+def synonymous_AAs():
+  # amino acids with more than one tRNA in SingleAA
+  return sorted([AA for AA in SingleAA if len(tRNA_names(SingleAA[AA])) > 1])
+
+def tRNA_sequence(sequenceAA, pooled=False, rule=ROTATE):
+  # the tRNA used at every position, as the simulation engines see it
+  # (tRNASequences.py): an amino acid with synonymous tRNAs picks them by
+  # 'rule', by default in turn, one per occurrence in the protein
+  tRNAs = encode(sequenceAA, SingleAA, rule)
+  if pooled:
+    pools = set(synonymous_AAs())
+    tRNAs = ['pool_' + AA if AA in pools else tRNA for AA, tRNA in zip(sequenceAA, tRNAs)]
+  return tRNAs
+
+def tRNA_positions(sequenceAA, pooled=False):
+  # Index-to-tRNA mapping of one protein (from SingleAA), inverted into the
+  # positions at which each tRNA is used.  Returns a list of
+  # (AA, iterator, tRNA, positions) in order of first use, where iterator
+  # numbers the synonymous tRNAs as in the riboPos_Elongation IDs.
+  groups = {}
+  order = []
+  for p in range(len(sequenceAA)):
+    tRNAs = elongation_tRNAs(sequenceAA[p], pooled)
+    for i in range(len(tRNAs)):
+      if tRNAs[i] not in groups:
+        groups[tRNAs[i]] = (sequenceAA[p], i + 1, tRNAs[i], [])
+        order.append(tRNAs[i])
+      groups[tRNAs[i]][3].append(p)
+  return [groups[tRNA] for tRNA in order]
+
+def riboPos_Elongation(model,startingPos,AAadded,tRNA_needed,iterator,nextPos=None):
   # Create a reaction inside this model, set the reactants and products,
   # and set the reaction rate expression (the SBML "kinetic law").  We
   # set the minimum required attributes for all of these objects.  The
@@ -104,6 +147,12 @@ def riboPos_Elongation(model,startingPos,AAadded,tRNA_needed,iterator):
   
   #STUFF THAT ACTUALLY CHANGES FROM REACTION TO REACTION 
 
+  #the next position is <protein>_p<n+1> unless given (the last residue
+  #moves the ribosome to <protein>_pF)
+  if nextPos is None:
+    protein, n = startingPos.rsplit('_p', 1)
+    nextPos = protein + '_p' + str(int(n) + 1)
+
   #Add the current Ribosome position
   species_ref1 = r1.createReactant()
   check(species_ref1,                       'create reactant')
@@ -112,7 +161,7 @@ def riboPos_Elongation(model,startingPos,AAadded,tRNA_needed,iterator):
   #Produce the Next Position
   species_ref6 = r1.createProduct()
   check(species_ref6,                       'create product')
-  check(species_ref6.setSpecies(startingPos[:-1]+str(int(startingPos[-1])+1)),      'assign product species')
+  check(species_ref6.setSpecies(nextPos),      'assign product species')
   check(species_ref6.setConstant(False),     'set "constant" on species ref 2')
   #Add the amino-acylated tRNA
   species_ref2 = r1.createReactant()
@@ -187,6 +236,125 @@ def riboPos_Elongation(model,startingPos,AAadded,tRNA_needed,iterator):
   check(kinetic_law,                        'create kinetic law')
   check(kinetic_law.setMath(math_ast),      'set math on kinetic law')
 
+def riboPos_ElongationBlock(model,startingPos,nextPos,tRNAs_needed):
+  # One reaction standing for a block of elongation steps ("alternative 3"
+  # in README_Joe.txt): the ribosome moves from startingPos straight to
+  # nextPos and consumes one aminoacylated tRNA per residue in tRNAs_needed,
+  # together with the GTP and H2O of every single step.  EF-G and EF-Tu are
+  # released again, so they keep a stoichiometry of 1.
+
+  steps = len(tRNAs_needed)
+  counts = {}
+  order = []
+  for tRNA in tRNAs_needed:
+    if tRNA not in counts:
+      counts[tRNA] = 0
+      order.append(tRNA)
+    counts[tRNA] = counts[tRNA] + 1
+
+  r1 = model.createReaction()
+  check(r1,                                 'create reaction')
+  check(r1.setName(startingPos+'_to_'+nextPos.split('_')[-1]),                     'set reaction name')
+  check(r1.setId(startingPos+'_to_'+nextPos.split('_')[-1]),                     'set reaction id')
+  check(r1.setReversible(False),            'set reaction reversibility flag')
+  check(r1.setFast(False),                  'set reaction "fast" attribute')
+
+  #STUFF THAT ACTUALLY CHANGES FROM REACTION TO REACTION 
+
+  #Add the current Ribosome position
+  species_ref1 = r1.createReactant()
+  check(species_ref1,                       'create reactant')
+  check(species_ref1.setSpecies(startingPos),      'assign reactant species')
+  check(species_ref1.setConstant(False),     'set "constant" on species ref 1')
+  #Produce the position at the end of the block
+  species_ref6 = r1.createProduct()
+  check(species_ref6,                       'create product')
+  check(species_ref6.setSpecies(nextPos),      'assign product species')
+  check(species_ref6.setConstant(False),     'set "constant" on species ref 2')
+  for tRNA in order:
+    #Add the amino-acylated tRNAs
+    species_ref2 = r1.createReactant()
+    check(species_ref2,                       'create reactant')
+    check(species_ref2.setSpecies('aminoacylated_'+ tRNA),      'assign reactant species')
+    check(species_ref2.setConstant(False),     'set "constant" on species ref 2')
+    check(species_ref2.setStoichiometry(counts[tRNA]),     'set "coefficient" on species ref 2')
+    #Produce the Unloaded tRNAs
+    species_ref7 = r1.createProduct()
+    check(species_ref7,                       'create product')
+    check(species_ref7.setSpecies(tRNA),      'assign product species')
+    check(species_ref7.setConstant(False),     'set "constant" on species ref 7')
+    check(species_ref7.setStoichiometry(counts[tRNA]),     'set "coefficient" on species ref 7')
+
+  #STUFF THAT IS THE SAME FOR ALL REACTIONS, scaled by the block length
+  for species, stoichiometry in [('GTP', 2 * steps), ('MG_089_MONOMER', 1),
+                                 ('MG_451_MONOMER', 1), ('H2O', 2 * steps)]:
+    species_ref3 = r1.createReactant()
+    check(species_ref3,                       'create reactant')
+    check(species_ref3.setSpecies(species),      'assign reactant species')
+    check(species_ref3.setConstant(False),     'set "constant" on species ref 3')
+    check(species_ref3.setStoichiometry(stoichiometry),     'set "coefficient" on species ref 3')
+  for species, stoichiometry in [('GDP', 2 * steps), ('PI', 2 * steps), ('MG_089_MONOMER', 1),
+                                 ('MG_451_MONOMER', 1), ('H', 2 * steps)]:
+    species_ref8 = r1.createProduct()
+    check(species_ref8,                       'create product')
+    check(species_ref8.setSpecies(species),      'assign product species')
+    check(species_ref8.setConstant(True),     'set "constant" on species ref 8')
+    check(species_ref8.setStoichiometry(stoichiometry),     'set "coefficient" on species ref 8')
+
+  # k_block is k divided by the chunk size, so a ribosome still needs the
+  # same mean time to cover a block as it would for the single steps
+  math_ast = parseL3Formula('k_block * GTP * GTP * MG_089_MONOMER * MG_451_MONOMER * '+ startingPos)
+  check(math_ast,                           'create AST for rate expression')
+ 
+  kinetic_law = r1.createKineticLaw()
+  check(kinetic_law,                        'create kinetic law')
+  check(kinetic_law.setMath(math_ast),      'set math on kinetic law')
+
+def tRNA_pool_Exchange(model,AA,tRNA):
+  # Keeps the lumped pool of an amino acid with synonymous tRNAs consistent
+  # with the individual tRNA species of the aminoacylation model: charged
+  # tRNA moves into aminoacylated_pool_<AA>, and discharged tRNA goes back
+  # from pool_<AA> to the individual tRNAs (evenly, as its identity is lost
+  # in the pool).
+
+  r1 = model.createReaction()
+  check(r1,                                 'create reaction')
+  check(r1.setId('aminoacylated_'+tRNA+'_to_pool'),                     'set reaction id')
+  check(r1.setReversible(False),            'set reaction reversibility flag')
+  check(r1.setFast(False),                  'set reaction "fast" attribute')
+  species_ref1 = r1.createReactant()
+  check(species_ref1,                       'create reactant')
+  check(species_ref1.setSpecies('aminoacylated_'+tRNA),      'assign reactant species')
+  check(species_ref1.setConstant(False),     'set "constant" on species ref 1')
+  species_ref2 = r1.createProduct()
+  check(species_ref2,                       'create product')
+  check(species_ref2.setSpecies('aminoacylated_pool_'+AA),      'assign product species')
+  check(species_ref2.setConstant(False),     'set "constant" on species ref 2')
+  math_ast = parseL3Formula('k_exchange * aminoacylated_'+tRNA)
+  check(math_ast,                           'create AST for rate expression')
+  kinetic_law = r1.createKineticLaw()
+  check(kinetic_law,                        'create kinetic law')
+  check(kinetic_law.setMath(math_ast),      'set math on kinetic law')
+
+  r2 = model.createReaction()
+  check(r2,                                 'create reaction')
+  check(r2.setId('pool_'+AA+'_to_'+tRNA),                     'set reaction id')
+  check(r2.setReversible(False),            'set reaction reversibility flag')
+  check(r2.setFast(False),                  'set reaction "fast" attribute')
+  species_ref3 = r2.createReactant()
+  check(species_ref3,                       'create reactant')
+  check(species_ref3.setSpecies('pool_'+AA),      'assign reactant species')
+  check(species_ref3.setConstant(False),     'set "constant" on species ref 3')
+  species_ref4 = r2.createProduct()
+  check(species_ref4,                       'create product')
+  check(species_ref4.setSpecies(tRNA),      'assign product species')
+  check(species_ref4.setConstant(False),     'set "constant" on species ref 4')
+  math_ast = parseL3Formula('k_exchange * pool_'+AA)
+  check(math_ast,                           'create AST for rate expression')
+  kinetic_law = r2.createKineticLaw()
+  check(kinetic_law,                        'create kinetic law')
+  check(kinetic_law.setMath(math_ast),      'set math on kinetic law')
+
 def riboPos_Termination(model,protSeq):
   # Create a reaction inside this model, set the reactants and products,
   # and set the reaction rate expression (the SBML "kinetic law").  We
@@ -495,62 +663,305 @@ def Initiation_reaction_1(model):
     check(species_ref9,                       'create product')
     check(species_ref9.setSpecies('RIBOSOME_30S_IF3'),      'assign product species')
     check(species_ref9.setConstant(False),     'set "constant" on species ref 2')
+
+    math_ast = parseL3Formula('k * MG_196_MONOMER * RIBOSOME_30S')
+    check(math_ast,                           'create AST for rate expression')
+
+    kinetic_law = r1.createKineticLaw()
+    check(kinetic_law,                        'create kinetic law')
+    check(kinetic_law.setMath(math_ast),      'set math on kinetic law')
+def tRNA_counts(tRNAs):
+  # (tRNA, number of uses) in order of first use
+  counts = {}
+  order = []
+  for tRNA in tRNAs:
+    if tRNA not in counts:
+      counts[tRNA] = 0
+      order.append(tRNA)
+    counts[tRNA] = counts[tRNA] + 1
+  return [(tRNA, counts[tRNA]) for tRNA in order]
+
+def Translation_initiation_Bulk(model, Protein_name, tRNAs_needed):
+  # Initiation of the reduced model (create_model(..., reduced=True)): the
+  # initiation reaction, which in addition takes every aminoacylated tRNA
+  # and the GTP and H2O of all elongation steps up front, and puts the
+  # ribosome on <protein>_elongating instead of <protein>_p0.  The
+  # elongation factors only set the speed of the single steps and are not
+  # taken.
+
+  Translation_initiation_Reaction(model, Protein_name)
+  r1 = model.getReaction(Protein_name+'_Transl_Init')
+  steps = len(tRNAs_needed)
+  for i in range(r1.getNumReactants()):
+    species_ref = r1.getReactant(i)
+    if species_ref.getSpecies() in ('GTP', 'H2O'):
+      check(species_ref.setStoichiometry(1 + 2 * steps),     'set "coefficient" on '+species_ref.getSpecies())
+  for i in range(r1.getNumProducts()):
+    species_ref = r1.getProduct(i)
+    if species_ref.getSpecies() == Protein_name+'_p0':
+      check(species_ref.setSpecies(Protein_name+'_elongating'),      'assign product species')
+  for tRNA, count in tRNA_counts(tRNAs_needed):
+    species_ref2 = r1.createReactant()
+    check(species_ref2,                       'create reactant')
+    check(species_ref2.setSpecies('aminoacylated_'+ tRNA),      'assign reactant species')
+    check(species_ref2.setConstant(False),     'set "constant" on species ref 2')
+    check(species_ref2.setStoichiometry(count),     'set "coefficient" on species ref 2')
+
+def Translation_delayed_Elongation(model, Protein_name, tRNAs_needed):
+  # The whole elongation of the reduced model: <protein>_elongating moves to
+  # <protein>_pF and releases the tRNAs, GDP, PI and H of all steps taken
+  # by Translation_initiation_Bulk.  The rate k_<protein>_elongation is the
+  # elongation rate over the length, so as a first-order reaction the
+  # transit takes L / elongation_rate seconds on average; the delay
+  # simulator (simulation/delaySSA.py) fires it exactly that long after
+  # each initiation.
+
+  steps = len(tRNAs_needed)
+  r1 = model.createReaction()
+  check(r1,                                 'create reaction')
+  check(r1.setName(Protein_name+'_elongation'),                     'set reaction name')
+  check(r1.setId(Protein_name+'_elongation'),                     'set reaction id')
+  check(r1.setReversible(False),            'set reaction reversibility flag')
+  check(r1.setFast(False),                  'set reaction "fast" attribute')
+
+  species_ref1 = r1.createReactant()
+  check(species_ref1,                       'create reactant')
+  check(species_ref1.setSpecies(Protein_name+'_elongating'),      'assign reactant species')
+  check(species_ref1.setConstant(False),     'set "constant" on species ref 1')
+  species_ref6 = r1.createProduct()
+  check(species_ref6,                       'create product')
+  check(species_ref6.setSpecies(Protein_name+'_pF'),      'assign product species')
+  check(species_ref6.setConstant(False),     'set "constant" on species ref 6')
+  for species, stoichiometry in tRNA_counts(tRNAs_needed) + [('GDP', 2 * steps), ('PI', 2 * steps),
+                                                             ('H', 2 * steps)]:
+    species_ref7 = r1.createProduct()
+    check(species_ref7,                       'create product')
+    check(species_ref7.setSpecies(species),      'assign product species')
+    check(species_ref7.setConstant(False),     'set "constant" on species ref 7')
+    check(species_ref7.setStoichiometry(stoichiometry),     'set "coefficient" on species ref 7')
+
+  math_ast = parseL3Formula('k_'+Protein_name+'_elongation * '+Protein_name+'_elongating')
+  check(math_ast,                           'create AST for rate expression')
+
+  kinetic_law = r1.createKineticLaw()
+  check(kinetic_law,                        'create kinetic law')
+  check(kinetic_law.setMath(math_ast),      'set math on kinetic law')
+
 #########################################################################
 
-def create_model(names,lengthsofseq,sequenceAAs):
-  """Returns a simple but complete SBML Level 3 model for illustration."""
+def flush(out, elements):
+  # hands the elements built so far to the stream writer or fragment
+  # collector 'out'; without one they simply stay in the in-memory model
+  if out is not None:
+    out.write(elements)
 
-  # Create an empty SBMLDocument object.  It's a good idea to check for
-  # possible errors.  Even when the parameter values are hardwired like
-  # this, it is still possible for a failure to occur (e.g., if the
-  # operating system runs out of memory).
+def flush_arrayed(out, elements, edit):
+  # like flush, but every element's XML is passed through 'edit', which
+  # adds the arrays package markup libSBML cannot write
+  for i in range(elements.size()):
+    out.write_xml(elements.getElementName(), edit(elements.get(i).toSBML()))
+  elements.clear()
 
-  try:
-    document = SBMLDocument(3, 1)
-  except ValueError:
-    raise SystemExit('Could not create SBMLDocumention object')
+#########################################################################
+# Per-protein parts of the model.  Each writes one SBML section for one
+# protein, so proteins can be streamed one at a time or built in parallel.
+#########################################################################
 
-  # Create the basic Model object inside the SBMLDocument object.  To
-  # produce a model with complete units for the reaction rates, we need
-  # to set the 'timeUnits' and 'extentUnits' attributes on Model.  We
-  # set 'substanceUnits' too, for good measure, though it's not strictly
-  # necessary here because we also set the units for invididual species
-  # in their definitions.
+def protein_species(model, out, name, length, sequenceAA, options):
+  # Create ribosome position species (one for each position plus a final one)
+  if options['reduced']:
+    #ribosomes in transit and the final position
+    create_species(model, name + '_elongating')
+    create_species(model, name + '_pF')
+    flush(out, model.getListOfSpecies())
+    return
 
-  model = document.createModel()
-  check(model,                              'create model')
-  check(model.setTimeUnits("second"),       'set model-wide time units')
-  check(model.setExtentUnits("item"),       'set model units of extent')
-  check(model.setSubstanceUnits('item'),    'set model substance units')
+  if options['arrays']:
+    #all positions as one arrayed species
+    create_species(model, name + '_p')
+    flush_arrayed(out, model.getListOfSpecies(),
+                  lambda xml: add_dimensions(xml, [('i', name + '_size')]))
+    return
 
-  # Create a unit definition we will need later.  Note that SBML Unit
-  # objects must have all four attributes 'kind', 'exponent', 'scale'
-  # and 'multiplier' defined.
+  #create the #AA positions (one per block when chunking)
+  for p in range(0, length, options['chunk_size']):
+    create_species(model, name + '_p' + str(p))
+
+  #create the final position
+  create_species(model, name + '_pF')
+  flush(out, model.getListOfSpecies())
+
+def protein_parameters(model, out, name, length, sequenceAA, options):
+  # array sizes and the position vectors of every tRNA (arrays only), or
+  # the elongation rate constant of the reduced model
+  if options['reduced']:
+    k1 = model.createParameter()
+    check(k1,                                  'create parameter k_elongation')
+    check(k1.setId('k_' + name + '_elongation'),                       'set parameter k_elongation id')
+    check(k1.setConstant(True),                'set parameter k_elongation "constant"')
+    check(k1.setValue(float(options['elongation_rate']) / max(length, 1)),                      'set parameter k_elongation value')
+    check(k1.setUnits('per_second'),           'set parameter k_elongation units')
+    flush(out, model.getListOfParameters())
+    return
+  if not options['arrays']:
+    return
+  groups = tRNA_positions(sequenceAA[:length], options['pool_synonymous'])
+  create_index_parameter(model, name + '_size', length + 1)
+  for AA, i, tRNA, positions in groups:
+    create_index_parameter(model, name + '_' + tRNA + '_n', len(positions))
+  flush(out, model.getListOfParameters())
+  for AA, i, tRNA, positions in groups:
+    create_index_parameter(model, name + '_' + tRNA + '_pos')
+    flush_arrayed(out, model.getListOfParameters(),
+                  lambda xml: add_dimensions(xml, [('i', name + '_' + tRNA + '_n')]))
+
+def protein_initial_assignments(model, out, name, length, sequenceAA, options):
+  # values of the position vectors (arrays only)
+  if not options['arrays']:
+    return
+  for AA, i, tRNA, positions in tRNA_positions(sequenceAA[:length], options['pool_synonymous']):
+    out.write_xml('listOfInitialAssignments', vector_assignment(name + '_' + tRNA + '_pos', positions))
+
+def protein_reactions(model, out, name, length, sequenceAA, options):
+  if options['reduced']:
+    # Initiation with all elongation resources, one delayed elongation
+    # and the usual termination
+    tRNAs = tRNA_sequence(sequenceAA[:length], options['pool_synonymous'], options['synonyms'])
+    Translation_initiation_Bulk(model, name, tRNAs)
+    Translation_delayed_Elongation(model, name, tRNAs)
+    riboPos_Termination(model ,name)
+    flush(out, model.getListOfReactions())
+    return
 
-  # per_second = model.createUnitDefinition()
-  # check(per_second,                         'create unit definition')
-  # check(per_second.setId('per_second'),     'set unit definition id')
-  # unit = per_second.createUnit()
-  # check(unit,                               'create unit on per_second')
-  # check(unit.setKind(UNIT_KIND_SECOND),     'set unit kind')
-  # check(unit.setExponent(-1),               'set unit exponent')
-  # check(unit.setScale(0),                   'set unit scale')
-  # check(unit.setMultiplier(1),              'set unit multiplier')
+  # Initiation
+  Translation_initiation_Reaction(model,name)
+  if options['arrays']:
+    flush_arrayed(out, model.getListOfReactions(),
+                  lambda xml: index_species(xml, name + '_p0', name + '_p', cn(0)))
 
-  # Create a compartment inside this model, and set the required
-  # attributes for an SBML compartment in SBML Level 3.
+  # Elongation
+  pooled = options['pool_synonymous']
+  if options['arrays']:
+    # one reaction per tRNA, arrayed over the positions that use it; it is
+    # built for position 0 and then re-indexed to position _pos[j]
+    for AA, i, tRNA, positions in tRNA_positions(sequenceAA[:length], pooled):
+      riboPos_Elongation(model ,name + '_p0',AA,tRNA,i)
+      r1 = model.getReaction(model.getNumReactions() - 1)
+      check(r1.setName(name+'_plus_'+AA+str(i)),                     'set reaction name')
+      check(r1.setId(name+'_plus_'+AA+str(i)),                     'set reaction id')
+      position = selector(ci(name + '_' + tRNA + '_pos'), ci('j'))
+      flush_arrayed(out, model.getListOfReactions(),
+                    lambda xml: add_dimensions(
+                      index_species(index_species(xml, name + '_p0', name + '_p', position),
+                                    name + '_p1', name + '_p', plus(position, cn(1))),
+                      [('j', name + '_' + tRNA + '_n')]))
+
+  elif options['chunk_size'] > 1:
+    # one reaction per block (tRNA_sequence picks the synonymous tRNAs)
+    chunk_size = options['chunk_size']
+    tRNAs = tRNA_sequence(sequenceAA[:length], pooled, options['synonyms'])
+    for p in range(0, length, chunk_size):
+      if p + chunk_size < length:
+        nextPos = name + '_p' + str(p + chunk_size)
+      else:
+        nextPos = name + '_pF'
+      riboPos_ElongationBlock(model ,name + '_p' + str(p),nextPos,tRNAs[p:p + chunk_size])
 
-  c1 = model.createCompartment()
-  check(c1,                                 'create compartment')
-  check(c1.setId('c'),                     'set compartment id')
-  check(c1.setConstant(True),               'set compartment "constant"')
-  check(c1.setSize(1),                      'set compartment "size"')
-  check(c1.setSpatialDimensions(3),         'set compartment dimensions')
-  check(c1.setUnits('litre'),               'set compartment size units')
+  else:
+    #create the #AA positions
+    for p in range(length):
+      if p + 1 < length:
+        nextPos = name + '_p' + str(p + 1)
+      else:
+        nextPos = name + '_pF'
+
+      i=1
+      for id in elongation_tRNAs(sequenceAA[p], pooled):
+      #riboPos_Elongation(model,startingPos             ,AAadded       ,tRNA_needed,iterator,nextPos):
+        riboPos_Elongation(model ,name + '_p' + str(p),sequenceAA[p],id         ,i       ,nextPos)
+        i=i+1
+  flush(out, model.getListOfReactions())
+
+  # Termination
+  riboPos_Termination(model ,name)
+  if options['arrays']:
+    flush_arrayed(out, model.getListOfReactions(),
+                  lambda xml: index_species(xml, name + '_pF', name + '_p', cn(length)))
+  flush(out, model.getListOfReactions())
+
+PROTEIN_PARTS = [protein_species, protein_parameters, protein_initial_assignments, protein_reactions]
+
+def protein_fragments(task):
+  # Worker of the sharded mode: builds part 'part' (an index into
+  # PROTEIN_PARTS) of one protein in a scratch model and returns the
+  # serialised elements as a list of (section, xml).
+  part, name, length, sequenceAA, options = task
+  scratch = SBMLDocument(3, 1)
+  model = scratch.createModel()
+  check(model,                            'create scratch model')
+  out = SBMLFragmentCollector()
+  PROTEIN_PARTS[part](model, out, name, length, sequenceAA, options)
+  return out.fragments
+
+#########################################################################
 
-  #############################################
-  # Create def create_model(names,lengthsofseq,sequenceAAs):
-  """Returns a simple but complete SBML Level 3 model for illustration."""
+def create_model(names,lengthsofseq,sequenceAAs,filename='model_toy.xml',stream=False,chunk_size=1,arrays=False,
+                 pool_synonymous=False,processes=1,compact_ids=False,cache_dir=None,reduced=False,
+                 elongation_rate=ELONGATION_RATE,synonyms=ROTATE):
+  """Returns a simple but complete SBML Level 3 model for illustration.
+
+  With stream=True nothing but a scratch model is kept in memory: species,
+  parameters and reactions are written to 'filename' protein by protein
+  through an SBMLStreamWriter, so the full genome can be generated.
+
+  With chunk_size > 1 every elongation reaction adds a block of chunk_size
+  amino acids (riboPos_ElongationBlock), and only the positions at the
+  start of each block get a species.
+
+  With arrays=True (always streamed) the output uses the SBML arrays
+  package: the positions of a protein are one arrayed species
+  <protein>_p (index L is the final position) and there is one arrayed
+  elongation reaction per protein and tRNA, running over the vector
+  <protein>_<tRNA>_pos of positions that use it.
+
+  With pool_synonymous=True an amino acid with several tRNAs in SingleAA
+  is added by a single reaction per position, consuming the lumped
+  aminoacylated_pool_<AA>; tRNA_pool_Exchange reactions keep the pools
+  and the individual aminoacylated_MGxxx species consistent.
+
+  With processes > 1 (always streamed) the proteins are built by a pool of
+  worker processes and their fragments are written in protein order; the
+  species and reactions shared by all proteins are written once by the
+  parent.  The file is identical to the one written with stream=True.
+
+  With compact_ids=True (always streamed) species, reactions and
+  parameters get short IDs (s0, r0, p0, ...); the original names are
+  written to <filename without extension>_names.tsv (see compactIds.py).
+
+  With cache_dir (always streamed) the elements of every protein are kept
+  in a FragmentCache in that directory, keyed by the protein's ID, length
+  and sequence, the options, SingleAA and this script; a rerun only
+  rebuilds the proteins whose key changed (see fragmentCache.py).
+
+  With reduced=True a protein has no position species: its initiation
+  takes the aminoacylated tRNAs, GTP and H2O of the whole protein at once
+  and puts the ribosome on <protein>_elongating, and a single reaction
+  <protein>_elongation with rate elongation_rate / L moves it to
+  <protein>_pF and releases the tRNAs, GDP, PI and H.  The full genome is
+  then a few reactions per protein; simulation/delaySSA.py fires the
+  elongations after a fixed delay of L / elongation_rate seconds.
+
+  The chunked and reduced models name one tRNA per position; where an
+  amino acid has synonymous tRNAs, 'synonyms' is the rule of
+  tRNASequences.py picking them ('rotate', 'first' or 'random'), so that
+  these models use the same tRNAs as a simulation engine given that rule.
+  """
+  if arrays and chunk_size > 1:
+    raise ValueError('arrays output does not support chunk_size > 1')
+  if reduced and (arrays or chunk_size > 1):
+    raise ValueError('reduced output does not support arrays or chunk_size > 1')
+  options = {'chunk_size': chunk_size, 'arrays': arrays, 'pool_synonymous': pool_synonymous,
+             'reduced': reduced, 'elongation_rate': elongation_rate, 'synonyms': synonyms}
 
   # Create an empty SBMLDocument object.  It's a good idea to check for
   # possible errors.  Even when the parameter values are hardwired like
@@ -600,114 +1011,194 @@ def create_model(names,lengthsofseq,sequenceAAs):
   check(c1.setSpatialDimensions(3),         'set compartment dimensions')
   check(c1.setUnits('litre'),               'set compartment size units')
 
-  #################################################################
-  ## Species part
-   # Create ribosome position species (one for each position plus a final one)
-
-  for n in range(len(names)): 
-
-    #create the #AA positions
-    for p in range(int(lengthsofseq[n])):
-      create_species(model, names[n] + '_p' + str(p))
-
-    #create the final position
-    create_species(model, names[n] + '_pF')
-
-
-    # Species (IFs)
-    ## TODO set initialAmount
-    ## TODO 'RF1_50S_30S'
-  initialAmount=1 
-  SpeciesList = ['RIBOSOME_30S_IF3','RIBOSOME_50S','MG_143_MONOMER',
-                 'RIBOSOME_30S', 'MG_173_MONOMER', 'MG_142_MONOMER', 'MG_196_MONOMER','RF1_50S_30S']
-  for One_Specie in SpeciesList:
-    create_species(model,One_Specie,initialAmount)
-
-    # species initialization STUFF THAT IS THE SAME FOR ALL REACTIONS
-    ## TODO set initialAmount
-    ## TODO 'RF1_30S_50S'
-  initialAmount=1 
-  SpeciesList = ['GTP', 'MG_089_MONOMER', 'MG_451_MONOMER', 'H2O', 'GDP', 'PI', 'MG_089_MONOMER',
-                 'MG_451_MONOMER', 'H', 'MG_258_MONOMER', 'MG_143_MONOMER' , 'MG_173_MONOMER'
-                 'MG_142_MONOMER', 'RF1_30S_50S'] 
-  for One_Specie in SpeciesList:
-    create_species(model,One_Specie,initialAmount)
+  # In streaming mode the document above only provides the header; all
+  # other elements are created in a scratch model and flushed to disk.
+  writer = None
+  ids = None
+  if stream or arrays or processes > 1 or compact_ids or cache_dir is not None:
+    packages = []
+    if arrays:
+      packages = [('arrays', ARRAYS_NS)]
+    if compact_ids:
+      ids = CompactIds()
+    writer = SBMLStreamWriter(document, filename, packages=packages, ids=ids)
+    scratch = SBMLDocument(3, 1)
+    model = scratch.createModel()
+    check(model,                            'create scratch model')
+
+  pool = None
+  if processes > 1:
+    import multiprocessing
+    pool = multiprocessing.Pool(processes)
+
+  # the workers are stopped however the model building ends
+  try:
+    cache = None
+    if cache_dir is not None:
+      # the fragments also depend on the helper modules that build them
+      # and on the libSBML that serialises them
+      sources = [__file__, tRNASequences.__file__, SBMLarrays.__file__, compactIds.__file__,
+                 SBMLstreamWriter.__file__]
+      cache = FragmentCache(cache_dir, [SingleAA, getLibSBMLDottedVersion()] +
+                                       [file_hash(os.path.abspath(path)) for path in sources])
+
+    def proteins(part):
+      # runs one of PROTEIN_PARTS for every protein, here, in the pool or
+      # from the fragment cache
+      if pool is None and cache is None:
+        for n in range(len(names)):
+          PROTEIN_PARTS[part](model, writer, names[n], int(lengthsofseq[n]), sequenceAAs[n], options)
+        return
+      tasks = [(part, names[n], int(lengthsofseq[n]), sequenceAAs[n], options) for n in range(len(names))]
+      if cache is None:
+        results = pool.imap(protein_fragments, tasks, 4)
+      else:
+        results = cache.fragments(tasks, protein_fragments, pool)
+      for fragments in results:
+        for section, xml in fragments:
+          writer.write_xml(section, xml)
+
+    #################################################################
+    ## Species part
+    proteins(0)
+
+      # Species (IFs)
+      ## TODO set initialAmount
+      ## TODO 'RF1_50S_30S'
+    initialAmount=1 
+    SpeciesList = ['RIBOSOME_30S_IF3','RIBOSOME_50S','MG_143_MONOMER',
+                   'RIBOSOME_30S', 'MG_173_MONOMER', 'MG_142_MONOMER', 'MG_196_MONOMER','RF1_50S_30S']
+    declared = set(SpeciesList)
+    for One_Specie in SpeciesList:
+      create_species(model,One_Specie,initialAmount)
+
+      # species initialization STUFF THAT IS THE SAME FOR ALL REACTIONS
+      # (the IFs above are already declared)
+      ## TODO set initialAmount
+      ## TODO 'RF1_30S_50S'
+    initialAmount=1 
+    SpeciesList = ['GTP', 'MG_089_MONOMER', 'MG_451_MONOMER', 'H2O', 'GDP', 'PI',
+                   'H', 'MG_258_MONOMER', 'RF1_30S_50S'] 
+    declared.update(SpeciesList)
+    for One_Specie in SpeciesList:
+      create_species(model,One_Specie,initialAmount)
+
+      # the finished monomers released by termination (unless declared above
+      # as translation factors)
+    for One_Specie in names:
+      if One_Specie not in declared:
+        create_species(model,One_Specie)
 
     
-    ## TODO set initialAmount
-  initialAmount=1 
-  SpeciesList = mRNAnames
-  for One_Specie in SpeciesList:
-    create_species(model,One_Specie,initialAmount)
-    One_Specie = 'aminoacylated_'+ One_Specie
-    create_species(model,One_Specie,initialAmount)
-
-################################################################
+      ## TODO set initialAmount
+    initialAmount=1 
+    SpeciesList = mRNAnames
+    for One_Specie in SpeciesList:
+      create_species(model,One_Specie,initialAmount)
+      One_Specie = 'aminoacylated_'+ One_Specie
+      create_species(model,One_Specie,initialAmount)
+    if pool_synonymous:
+      #lumped pools of the synonymous tRNAs, filled by the exchange reactions
+      for AA in synonymous_AAs():
+        create_species(model,'pool_'+AA)
+        create_species(model,'aminoacylated_pool_'+AA)
+    flush(writer, model.getListOfSpecies())
+
+  ################################################################
    
-  # Create a parameter object inside this model, set the required
-  # attributes 'id' and 'constant' for a parameter in SBML Level 3, and
-  # initialize the parameter with a value along with its units.
-
-  k = model.createParameter()
-  check(k,                                  'create parameter k')
-  check(k.setId('k'),                       'set parameter k id')
-  check(k.setConstant(True),                'set parameter k "constant"')
-  check(k.setValue(1),                      'set parameter k value')
-  check(k.setUnits('per_second'),           'set parameter k units')
-
-    #k2 parameters for the initiation rate 
-  k2 = model.createParameter()
-  check(k2,                                  'create parameter k')
-  check(k2.setId('k2'),                       'set parameter k id')
-  check(k2.setConstant(True),                'set parameter k "constant"')
-  # needs to be modified  
-  check(k2.setValue(1),                      'set parameter k value')
-  check(k2.setUnits('per_second'),           'set parameter k units')
-
-
-
-
-  #############################################
-  # Create ribosome position reactions 
-  #############################################
-  # Initiation
-  Initiation_reaction_1(model)
-  for Protein_name in prot_names:
-    Translation_initiation_Reaction(model,Protein_name)
-
-  # Elongation
-  for n in range(len(names)): 
-
-    #create the #AA positions
-    for p in range(int(lengthsofseq[n])):
-
-      if isinstance(SingleAA[sequence[n][p]],basestring):
-          riboPos_Elongation(model ,names[n] + '_p' + str(p),sequence[n][p],SingleAA[sequence[n][p]],1)
-      else:
-          i=1
-          for id in SingleAA[sequence[n][p]]:
-          #riboPos_Elongation(model,startingPos             ,AAadded       ,tRNA_needed,iterator):
-            riboPos_Elongation(model ,names[n] + '_p' + str(p),sequence[n][p],id         ,i)
-            i=i+1
-
-
-
-  for n in range(len(names)):
-    riboPos_Termination(model ,names[n])
-  riboPos_Termination2(model)
+    # Create a parameter object inside this model, set the required
+    # attributes 'id' and 'constant' for a parameter in SBML Level 3, and
+    # initialize the parameter with a value along with its units.
+
+    k = model.createParameter()
+    check(k,                                  'create parameter k')
+    check(k.setId('k'),                       'set parameter k id')
+    check(k.setConstant(True),                'set parameter k "constant"')
+    check(k.setValue(1),                      'set parameter k value')
+    check(k.setUnits('per_second'),           'set parameter k units')
+
+      #k2 parameters for the initiation rate 
+    k2 = model.createParameter()
+    check(k2,                                  'create parameter k')
+    check(k2.setId('k2'),                       'set parameter k id')
+    check(k2.setConstant(True),                'set parameter k "constant"')
+    # needs to be modified  
+    check(k2.setValue(1),                      'set parameter k value')
+    check(k2.setUnits('per_second'),           'set parameter k units')
+
+    if chunk_size > 1:
+      #k_block parameter for the elongation of a whole block
+      k_block = model.createParameter()
+      check(k_block,                                  'create parameter k_block')
+      check(k_block.setId('k_block'),                       'set parameter k_block id')
+      check(k_block.setConstant(True),                'set parameter k_block "constant"')
+      check(k_block.setValue(1.0 / chunk_size),                      'set parameter k_block value')
+      check(k_block.setUnits('per_second'),           'set parameter k_block units')
+
+    if pool_synonymous:
+      #k_exchange parameter, fast compared with elongation so that the pools
+      #follow the individual tRNAs closely
+      k_exchange = model.createParameter()
+      check(k_exchange,                                  'create parameter k_exchange')
+      check(k_exchange.setId('k_exchange'),                       'set parameter k_exchange id')
+      check(k_exchange.setConstant(True),                'set parameter k_exchange "constant"')
+      check(k_exchange.setValue(10),                      'set parameter k_exchange value')
+      check(k_exchange.setUnits('per_second'),           'set parameter k_exchange units')
+    flush(writer, model.getListOfParameters())
+
+    proteins(1)
+    proteins(2)
+
+
+    #############################################
+    # Create ribosome position reactions 
+    #############################################
+    Initiation_reaction_1(model)
+    flush(writer, model.getListOfReactions())
+
+    # Initiation, elongation and termination of every protein
+    proteins(3)
+
+    riboPos_Termination2(model)
+
+    if pool_synonymous:
+      for AA in synonymous_AAs():
+        for tRNA in SingleAA[AA]:
+          tRNA_pool_Exchange(model,AA,tRNA)
+    flush(writer, model.getListOfReactions())
+  finally:
+    if pool is not None:
+      pool.terminate()
+      pool.join()
 
   # And we're done creating the basic model.
   # Now return a text string containing the model in XML format.
- 
-  return writeSBMLToFile(document,'model_toy.xml')
+
+  if ids is not None:
+    ids.write_map(os.path.splitext(filename)[0] + '_names.tsv')
+  if writer is not None:
+    return writer.close()
+  return writeSBMLToFile(document,filename)
 
 if __name__ == '__main__':
 
-    #DO NOT RUN!
     # to create full  model (more that 1.3 Gb text file)
-    # comment out the next line and uncomment the last line
+    # comment out the next line and uncomment the last line; stream=True
+    # writes it protein by protein instead of holding it all in memory
     print(create_model(prot_names[0:3], prot_len[0:3], sequence[0:3]))
-  #   print(create_model(prot_names[0:len(prot_names)], prot_len[0:len(prot_len)], sequence[0:len(sequence)]))
+  #   print(create_model(prot_names, prot_len, sequence, 'model_full.xml', stream=True))
+    # blocks of 16 residues per reaction (~16 amino acids/second elongation)
+  #   print(create_model(prot_names, prot_len, sequence, 'model_chunked.xml', stream=True, chunk_size=16))
+    # SBML arrays package, file size proportional to the number of proteins
+  #   print(create_model(prot_names, prot_len, sequence, 'model_arrays.xml', arrays=True))
+    # full model built by 8 worker processes
+  #   print(create_model(prot_names, prot_len, sequence, 'model_full.xml', processes=8))
+    # short IDs, names in model_compact_names.tsv
+  #   print(create_model(prot_names, prot_len, sequence, 'model_compact.xml', compact_ids=True))
+    # reruns only rebuild the proteins that changed since the last run
+  #   print(create_model(prot_names, prot_len, sequence, 'model_full.xml', cache_dir='fragments'))
+    # one delayed elongation per protein instead of the position chains
+  #   print(create_model(prot_names, prot_len, sequence, 'model_reduced.xml', reduced=True))
   
 
 
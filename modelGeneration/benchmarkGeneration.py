@@ -0,0 +1,193 @@
+#################################
+# Generation benchmark
+#################################
+
+# Runs the model generators on growing protein subsets and records, per
+# configuration, the wall time, peak resident memory, number of species and
+# reactions and the size of the SBML file.  Every configuration runs in a
+# fresh Python process (so the peak memory is its own) and appends one JSON
+# object per line to the results file, which can be compared between
+# commits to catch generation-scaling regressions.
+#
+#   python benchmarkGeneration.py                         # default suite
+#   python benchmarkGeneration.py --sizes 3 10 --modes stream chunked
+#   python benchmarkGeneration.py --longest 50 --generators initial
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS = os.path.join(HERE, 'benchmark_results.jsonl')
+
+SIZES = [3, 10, 50, 100, 481]
+LONGEST = [10, 50]
+
+# create_model keyword arguments of TranslationSBMLgenerator per mode
+MODES = {
+    'memory': {},
+    'stream': {'stream': True},
+    'chunked': {'stream': True, 'chunk_size': 16},
+    'arrays': {'arrays': True},
+    'pooled': {'stream': True, 'pool_synonymous': True},
+    'compact': {'compact_ids': True},
+    'reduced': {'stream': True, 'reduced': True},
+}
+DEFAULT_MODES = ['stream', 'chunked', 'arrays']
+
+# generator name -> module; InitialModel.create_model always writes
+# model1.xml and takes no options
+GENERATORS = {
+    'translation': 'TranslationSBMLgenerator',
+    'initial': 'InitialModel',
+}
+
+
+def configurations(generators, modes, sizes, longest):
+    for generator in generators:
+        for mode in (modes if generator == 'translation' else ['memory']):
+            for n in sizes:
+                yield {'generator': generator, 'mode': mode, 'subset': 'first', 'proteins': n}
+            for n in longest:
+                yield {'generator': generator, 'mode': mode, 'subset': 'longest', 'proteins': n}
+
+
+def select(lengths, subset, n):
+    """Indices (in file order) of the first n or the n longest proteins."""
+    n = min(n, len(lengths))
+    if subset == 'first':
+        return list(range(n))
+    order = sorted(range(len(lengths)), key=lambda i: (-int(lengths[i]), i))
+    return sorted(order[:n])
+
+
+def count_elements(filename):
+    """Species and reactions in an SBML file, counted without parsing it
+    (an arrayed element counts once)."""
+    species = reactions = 0
+    with open(filename, 'rt') as f:
+        for line in f:
+            species += line.count('<species ')
+            reactions += line.count('<reaction ')
+    return species, reactions
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS; pool
+    # workers are reported as the largest child
+    import resource
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return scale * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def run_child(config):
+    """Runs one configuration in this process and returns its measurements.
+    The SBML file is written to, and removed with, a temporary directory."""
+    sys.path.insert(0, HERE)
+    start = time.time()
+    generator = __import__(GENERATORS[config['generator']])
+    loaded = time.time()
+    indices = select(generator.prot_len, config['subset'], config['proteins'])
+    names = [generator.prot_names[i] for i in indices]
+    lengths = [int(generator.prot_len[i]) for i in indices]
+    sequences = [generator.sequence[i] for i in indices]
+
+    directory = tempfile.mkdtemp(prefix='benchmark')
+    cwd = os.getcwd()
+    try:
+        os.chdir(directory)
+        start_generation = time.time()
+        if config['generator'] == 'translation':
+            generator.create_model(names, lengths, sequences, 'model.xml', **MODES[config['mode']])
+            filename = 'model.xml'
+        else:
+            generator.create_model(names, lengths, sequences)
+            filename = 'model1.xml'
+        wall = time.time() - start_generation
+        species, reactions = count_elements(filename)
+        size = os.path.getsize(filename)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    return {'load_seconds': loaded - start, 'wall_seconds': wall, 'peak_rss_bytes': peak_rss(),
+            'species': species, 'reactions': reactions, 'output_bytes': size,
+            'residues': sum(lengths)}
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE,
+                                         stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        import libsbml
+        libsbml_version = libsbml.getLibSBMLDottedVersion()
+    except ImportError:
+        libsbml_version = None
+    return {'commit': commit, 'python': platform.python_version(), 'libsbml': libsbml_version,
+            'host': platform.node(), 'machine': platform.machine()}
+
+
+def run(config, timeout=None):
+    """Runs one configuration in a new interpreter; the measurements are the
+    last line it prints."""
+    command = [sys.executable, os.path.abspath(__file__), '--child', json.dumps(config)]
+    start = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        out, err = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        return {'error': 'timeout after %g s' % timeout}
+    if process.returncode != 0:
+        lines = err.decode('utf-8', 'replace').strip().splitlines()
+        return {'error': lines[-1] if lines else 'exit status %d' % process.returncode}
+    result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+    result['process_seconds'] = time.time() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark SBML model generation on protein subsets.')
+    parser.add_argument('--generators', nargs='+', default=['translation'], choices=sorted(GENERATORS))
+    parser.add_argument('--modes', nargs='+', default=DEFAULT_MODES, choices=sorted(MODES),
+                        help='create_model options of the translation generator')
+    parser.add_argument('--sizes', nargs='*', type=int, default=SIZES, help='first-N protein subsets')
+    parser.add_argument('--longest', nargs='*', type=int, default=LONGEST, help='longest-N protein subsets')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per configuration')
+    parser.add_argument('--results', default=DEFAULT_RESULTS, help='JSON lines file the results are appended to')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(json.loads(args.child))))
+        return
+
+    env = environment()
+    stamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(args.results, 'at') as results:
+        for config in configurations(args.generators, args.modes, args.sizes, args.longest):
+            result = run(config, args.timeout)
+            record = dict(config, time=stamp, **env)
+            record.update(result)
+            results.write(json.dumps(record, sort_keys=True) + '\n')
+            results.flush()
+            if 'error' in result:
+                print('%(generator)s %(mode)s %(subset)s-%(proteins)d: ' % config + result['error'])
+            else:
+                print('%(generator)s %(mode)s %(subset)s-%(proteins)d: ' % config +
+                      '%(wall_seconds).2f s, %(peak_rss_bytes)d bytes RSS, %(species)d species, '
+                      '%(reactions)d reactions, %(output_bytes)d bytes' % result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#################################
+# Compact SBML identifiers
+#################################
+
+# Elongation reaction IDs such as MG_001_MONOMER_p9_plus_L3 and species
+# references such as aminoacylated_MG500 make up a large part of the
+# translation model.  CompactIds replaces them, while the model is being
+# written, by short IDs numbered in order of first appearance (s0, s1, ...
+# for species, r0, ... for reactions, p0, ... for parameters) and drops the
+# name attributes that only repeated the IDs.  The original names go to a
+# tab-separated sidecar file (compact ID, kind, name) that load_name_map
+# reads back to re-annotate simulation results.
+
+import re
+
+PREFIXES = {'species': 's', 'reaction': 'r', 'parameter': 'p'}
+
+# (element, attribute) -> kind of the identifier it holds
+ATTRIBUTE_KINDS = {
+    ('species', 'id'): 'species',
+    ('reaction', 'id'): 'reaction',
+    ('parameter', 'id'): 'parameter',
+    ('speciesReference', 'species'): 'species',
+    ('modifierSpeciesReference', 'species'): 'species',
+    ('initialAssignment', 'symbol'): 'parameter',
+    ('arrays:dimension', 'arrays:size'): 'parameter',
+}
+DEFINITIONS = ['species', 'reaction', 'parameter']
+
+TAG = re.compile(r'<(' + '|'.join(sorted(set(tag for tag, attribute in ATTRIBUTE_KINDS))) + r')\b([^>]*)>')
+ATTRIBUTE = re.compile(r'\s([\w:]+)="([^"]*)"')
+CI = re.compile(r'<ci> ([^ <]+) </ci>')
+
+
+class CompactIds(object):
+    """Maps SBML identifiers to compact ones; rewrite() applies the map to
+    one serialised element.  Identifiers that are neither species,
+    reactions nor parameters (compartments, array dimensions) are kept."""
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.counts = dict((kind, 0) for kind in PREFIXES)
+
+    def compact(self, name, kind):
+        if name not in self.ids:
+            self.ids[name] = PREFIXES[kind] + str(self.counts[kind])
+            self.counts[kind] += 1
+            self.names.append((self.ids[name], kind, name))
+        return self.ids[name]
+
+    def rewrite(self, xml):
+        xml = TAG.sub(self._tag, xml)
+        return CI.sub(self._ci, xml)
+
+    def write_map(self, filename):
+        with open(filename, 'wt') as f:
+            for compact, kind, name in self.names:
+                f.write(compact + '\t' + kind + '\t' + name + '\n')
+
+    def _tag(self, match):
+        tag = match.group(1)
+
+        def attribute(a):
+            if a.group(1) == 'name' and tag in DEFINITIONS:
+                return ''
+            kind = ATTRIBUTE_KINDS.get((tag, a.group(1)))
+            if kind is None:
+                return a.group(0)
+            return ' ' + a.group(1) + '="' + self.compact(a.group(2), kind) + '"'
+
+        return '<' + tag + ATTRIBUTE.sub(attribute, match.group(2)) + '>'
+
+    def _ci(self, match):
+        # only identifiers that are already known; <ci> also holds array
+        # dimension IDs
+        if match.group(1) in self.ids:
+            return '<ci> ' + self.ids[match.group(1)] + ' </ci>'
+        return match.group(0)
+
+
+def load_name_map(filename):
+    """Reads a sidecar written by CompactIds.write_map into
+    {compact ID: original name}."""
+    names = {}
+    with open(filename, 'rt') as f:
+        for line in f:
+            compact, kind, name = line.rstrip('\n').split('\t')
+            names[compact] = name
+    return names
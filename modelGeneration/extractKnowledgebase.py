@@ -0,0 +1,157 @@
+#################################
+# Knowledge base extraction
+#################################
+
+# Reads what the generators need directly from knowledgebase.xlsx instead of
+# going through GetProtSeq.R and ProtSeq.csv:
+#
+#   proteinMonomers  WholeCellModelID, Length, Sequence of every monomer
+#   genes            WholeCellModelID and Type of every RNA (mRNA, tRNA,
+#                    rRNA, sRNA), and the amino acid of every tRNA
+#
+# Parsing the 2.2MB workbook takes seconds, so the result is stored as a
+# binary snapshot next to it (the proteinSequences cache format, with the
+# RNA tables as metadata), keyed by the SHA-1 of the workbook.  Later runs
+# memory-map the snapshot; openpyxl is only needed to (re)build it.
+#
+#   python extractKnowledgebase.py              rebuild the snapshot
+#   python extractKnowledgebase.py ProtSeq.csv  ... and write ProtSeq.csv
+#
+# Without a usable snapshot and without openpyxl (or the workbook),
+# load_knowledgebase falls back to the files the generators read before:
+# ProtSeq.csv and Molecules_names_RNAs_Translation.csv, which have no RNA
+# types or tRNA amino acids.
+
+import os
+import sys
+import csv
+import warnings
+
+from proteinSequences import HERE, from_rows, load_sequences, read_cache, write_cache, file_hash
+
+KNOWLEDGEBASE = os.path.join(HERE, '..', 'knowledgebase.xlsx')
+RNA_NAMES_CSV = os.path.join(HERE, 'Molecules_names_RNAs_Translation.csv')
+SNAPSHOT_SUFFIX = '.snapshot'
+# bump when the content of the snapshot changes
+SNAPSHOT_VERSION = 1
+
+# MG_449_MONOMER has no sequence; GetProtSeq.R dropped it by hand
+EXCLUDED_MONOMERS = ['MG_449_MONOMER']
+RNA_TYPES = ['mRNA', 'rRNA', 'sRNA', 'tRNA']
+
+
+class Knowledgebase(object):
+    """The parts of the knowledge base used by the translation model.
+
+    proteins    ProteinSequences of the protein monomers
+    rna_names   IDs of all RNAs, in knowledge base order
+    rna_types   Type ('mRNA', 'tRNA', ...) of every RNA
+    tRNA_amino_acids   {tRNA ID: three-letter amino acid}
+    """
+
+    def __init__(self, proteins):
+        self.proteins = proteins
+        self.rna_names = proteins.metadata['rna_names']
+        self.rna_types = proteins.metadata['rna_types']
+        self.tRNA_amino_acids = proteins.metadata['tRNA_amino_acids']
+
+
+def load_knowledgebase(path=KNOWLEDGEBASE, snapshot=True):
+    """Returns the Knowledgebase of the workbook 'path', from its snapshot
+    when that was written for the current workbook by this version.  If the
+    snapshot cannot be used and the workbook cannot be read (no openpyxl or
+    no workbook), warns and returns load_csv_files()."""
+    if os.path.exists(path):
+        digest = file_hash(path)
+        snapshot_path = path + SNAPSHOT_SUFFIX
+        if snapshot and os.path.exists(snapshot_path):
+            proteins = read_cache(snapshot_path, digest)
+            if proteins is not None and proteins.metadata.get('snapshot_version') == SNAPSHOT_VERSION:
+                return Knowledgebase(proteins)
+        if have_openpyxl():
+            kb = extract(path)
+            if snapshot:
+                write_cache(snapshot_path, kb.proteins, digest)
+            return kb
+        reason = 'openpyxl is not installed (pip install openpyxl)'
+    else:
+        reason = path + ' does not exist'
+    warnings.warn('reading ProtSeq.csv and Molecules_names_RNAs_Translation.csv instead of the '
+                  'knowledge base: ' + reason)
+    return load_csv_files()
+
+
+def load_csv_files(csv_path=None, rna_names_path=RNA_NAMES_CSV):
+    """Knowledgebase of ProtSeq.csv (proteinSequences.load_sequences) and
+    the RNA IDs in the first column of Molecules_names_RNAs_Translation.csv;
+    the RNA types are '' and the tRNA amino acids unknown."""
+    proteins = load_sequences() if csv_path is None else load_sequences(csv_path)
+    with open(rna_names_path, 'rt') as f:
+        reader = csv.reader(f)
+        next(reader)  # skip the header
+        rna_names = [row[0] for row in reader if row]
+    proteins.metadata = dict(proteins.metadata, rna_names=rna_names,
+                             rna_types=[''] * len(rna_names), tRNA_amino_acids={})
+    return Knowledgebase(proteins)
+
+
+def have_openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        return False
+    return True
+
+
+def extract(path=KNOWLEDGEBASE):
+    """Stream-reads the proteinMonomers and genes sheets of the workbook."""
+    try:
+        import openpyxl
+    except ImportError:
+        raise SystemExit('openpyxl is needed to read ' + path + ' (pip install openpyxl)')
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        monomers = [row for row in read_sheet(workbook, 'proteinMonomers', ['WholeCellModelID', 'Length', 'Sequence'])
+                    if row[0] not in EXCLUDED_MONOMERS]
+        rnas = [row for row in read_sheet(workbook, 'genes', ['WholeCellModelID', 'Type', 'AminoAcid'])
+                if row[1] in RNA_TYPES]
+    finally:
+        workbook.close()
+
+    proteins = from_rows(monomers)
+    proteins.metadata = {
+        'snapshot_version': SNAPSHOT_VERSION,
+        'rna_names': [row[0] for row in rnas],
+        'rna_types': [row[1] for row in rnas],
+        'tRNA_amino_acids': dict((row[0], row[2]) for row in rnas if row[1] == 'tRNA'),
+    }
+    return Knowledgebase(proteins)
+
+
+def read_sheet(workbook, name, columns):
+    """Yields the given columns of every data row of sheet 'name'; empty
+    cells come back as ''."""
+    rows = workbook[name].iter_rows(values_only=True)
+    header = list(next(rows))
+    index = [header.index(column) for column in columns]
+    for row in rows:
+        if row[index[0]] is None:
+            continue
+        yield tuple('' if row[i] is None else row[i] for i in index)
+
+
+def write_protseq_csv(kb, filename):
+    # same layout as the ProtSeq.csv written by GetProtSeq.R
+    with open(filename, 'wt') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        writer.writerow(['WholeCellModelID', 'Length', 'Sequence'])
+        for n in range(len(kb.proteins)):
+            writer.writerow([kb.proteins.names[n], kb.proteins.lengths[n], kb.proteins.sequence(n)])
+
+
+if __name__ == '__main__':
+    kb = extract()
+    write_cache(KNOWLEDGEBASE + SNAPSHOT_SUFFIX, kb.proteins, file_hash(KNOWLEDGEBASE))
+    print(str(len(kb.proteins)) + ' protein monomers, ' + str(len(kb.rna_names)) + ' RNAs')
+    if len(sys.argv) > 1:
+        write_protseq_csv(kb, sys.argv[1])
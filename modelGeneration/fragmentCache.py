@@ -0,0 +1,85 @@
+#################################
+# Per-protein fragment cache
+#################################
+
+# Changing one protein sequence used to mean regenerating every protein.
+# FragmentCache keeps the serialised SBML elements that one part of
+# TranslationSBMLgenerator.PROTEIN_PARTS produced for one protein (the list
+# of (section, xml) of SBMLFragmentCollector), in a file named by a hash of
+# everything the part depends on: the task (part, protein ID, length,
+# sequence, generation options) and a salt with the tRNA map, the libSBML
+# version and the source of the generator and its helper modules.  A rerun
+# only builds the tasks whose hash is not in the cache and reassembles the
+# rest from disk; an entry that cannot be read is built again.  Entries are
+# never removed; delete the directory to start over.
+
+import os
+import json
+import zlib
+import pickle
+import hashlib
+
+ENTRY_SUFFIX = '.frag'
+
+
+class FragmentCache(object):
+    """Fragment files in 'directory', keyed by task and 'salt' (any JSON
+    serialisable value that invalidates all entries when it changes)."""
+
+    def __init__(self, directory, salt=None):
+        self.directory = directory
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, task):
+        text = json.dumps([self.salt, task], sort_keys=True)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return pickle.loads(zlib.decompress(f.read()))
+        except (IOError, OSError, EOFError, ValueError, zlib.error, pickle.UnpicklingError):
+            # missing, truncated or corrupt: built again and overwritten
+            return None
+
+    def put(self, key, fragments):
+        # written under a temporary name so that an interrupted run never
+        # leaves a truncated entry behind
+        tmp_path = self.path(key) + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(fragments, 2), 1))
+        os.rename(tmp_path, self.path(key))
+
+    def fragments(self, tasks, build, pool=None):
+        """Yields the fragments of every task in order, from the cache or
+        from build(task), which runs in 'pool' (a multiprocessing.Pool)
+        if given.  Newly built fragments are stored."""
+        keys = [self.key(task) for task in tasks]
+        missing = set(key for key in keys if not os.path.exists(self.path(key)))
+        todo = [tasks[n] for n in range(len(tasks)) if keys[n] in missing]
+        if pool is None:
+            built = map(build, todo)
+        else:
+            built = pool.imap(build, todo, 4)
+        built = iter(built)
+        for n in range(len(tasks)):
+            fragments = None
+            if keys[n] not in missing:
+                fragments = self.get(keys[n])
+            if fragments is None:
+                if keys[n] in missing:
+                    fragments = next(built)
+                else:
+                    fragments = build(tasks[n])  # removed since the check above
+                self.put(keys[n], fragments)
+                self.misses += 1
+            else:
+                self.hits += 1
+            yield fragments
@@ -0,0 +1,180 @@
+#################################
+# Protein sequence store
+#################################
+
+# All generators used to re-parse ProtSeq.csv at import time, growing
+# prot_names/prot_len/sequence with list = list + [x].  This module loads the
+# sequences once into three flat arrays
+#
+#   residues  uint8, the one-letter codes (ASCII) of all proteins back to back
+#   offsets   int64, protein n is residues[offsets[n]:offsets[n+1]]
+#   lengths   int32, the Length column of ProtSeq.csv
+#
+# and keeps them in a binary cache next to the csv file, which later runs
+# memory-map instead of parsing the csv again.
+
+import os
+import csv
+import json
+import hashlib
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSV = os.path.join(HERE, 'ProtSeq.csv')
+
+CACHE_MAGIC = b'PROTSEQ1'
+CACHE_SUFFIX = '.seqcache'
+
+
+class ProteinSequences(object):
+    """Protein IDs, lengths and sequences of ProtSeq.csv as flat arrays.
+
+    proteins[n] (or proteins['MG_001_MONOMER']) is a uint8 view into
+    residues, nothing is copied.  strings() gives the sequences as Python
+    strings for the SBML generators.
+    """
+
+    def __init__(self, names, lengths, offsets, residues, metadata=None):
+        self.names = names
+        self.lengths = lengths
+        self.offsets = offsets
+        self.residues = residues
+        # anything else stored with the cache (see extractKnowledgebase.py)
+        self.metadata = metadata or {}
+        self._index = dict((names[n], n) for n in range(len(names)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, n):
+        if not isinstance(n, (int, np.integer)):
+            n = self._index[n]
+        return self.residues[self.offsets[n]:self.offsets[n + 1]]
+
+    def index(self, name):
+        return self._index[name]
+
+    def sequence(self, n, first=None):
+        """Sequence of protein n as a string.  'first' replaces the first
+        residue, e.g. 'Z' for the formyl-Met convention of SingleAA."""
+        seq = self[n].tobytes().decode('ascii')
+        if first is not None:
+            seq = first + seq[1:]
+        return seq
+
+    def strings(self, first=None):
+        return [self.sequence(n, first) for n in range(len(self))]
+
+
+def load_sequences(path=DEFAULT_CSV, cache=True):
+    """Loads ProtSeq.csv (or another file with the same columns), from the
+    binary cache when it was written for the current contents of 'path'."""
+    digest = file_hash(path)
+    cache_path = path + CACHE_SUFFIX
+    if cache and os.path.exists(cache_path):
+        proteins = read_cache(cache_path, digest)
+        if proteins is not None:
+            return proteins
+    proteins = parse_csv(path)
+    if cache:
+        try:
+            write_cache(cache_path, proteins, digest)
+        except (IOError, OSError):
+            pass  # read-only checkout, just parse again next time
+    return proteins
+
+
+def parse_csv(path):
+    with open(path, 'rt') as f:
+        reader = csv.reader(f)
+        next(reader)  # skip the header
+        return from_rows(reader)
+
+
+def from_rows(rows):
+    """Builds the store from (ID, length, sequence) rows."""
+    names = []
+    lengths = []
+    chunks = []
+    for row in rows:
+        names.append(row[0])
+        lengths.append(int(row[1]))
+        chunks.append(row[2].encode('ascii'))
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(c) for c in chunks])
+    residues = np.frombuffer(b''.join(chunks), dtype=np.uint8)
+    return ProteinSequences(names, np.array(lengths, dtype=np.int32), offsets, residues)
+
+
+#########################################################################
+# Binary cache: magic, header length, JSON header (source hash, names,
+# metadata, array layout) and the raw arrays, each starting on an 8-byte
+# boundary.
+#########################################################################
+
+def write_cache(cache_path, proteins, digest):
+    arrays = [('lengths', proteins.lengths), ('offsets', proteins.offsets),
+              ('residues', proteins.residues)]
+    write_arrays(cache_path, CACHE_MAGIC, {'source': digest, 'names': proteins.names,
+                                           'metadata': proteins.metadata}, arrays)
+
+
+def read_cache(cache_path, digest=None):
+    """Memory-maps a cache written by write_cache.  Returns None if the file
+    is not a cache or was written for other csv contents than 'digest'."""
+    header, arrays = read_arrays(cache_path, CACHE_MAGIC)
+    if header is None or (digest is not None and header['source'] != digest):
+        return None
+    return ProteinSequences(header['names'], arrays['lengths'], arrays['offsets'], arrays['residues'],
+                            header.get('metadata'))
+
+
+def write_arrays(path, magic, header, arrays):
+    """Writes the JSON-able dict 'header' and the (name, array) list
+    'arrays' in the cache format, through a temporary file."""
+    layout = []
+    position = 0
+    for name, array in arrays:
+        layout.append([name, str(array.dtype), int(array.size), position])
+        position += _aligned(array.nbytes)
+    header = json.dumps(dict(header, arrays=layout)).encode('utf-8')
+    start = _aligned(len(magic) + 8 + len(header))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(magic)
+        f.write(np.array([len(header)], dtype='<u8').tobytes())
+        f.write(header)
+        f.write(b'\0' * (start - f.tell()))
+        for name, array in arrays:
+            data = np.ascontiguousarray(array).tobytes()
+            f.write(data)
+            f.write(b'\0' * (_aligned(len(data)) - len(data)))
+    os.rename(tmp_path, path)
+
+
+def read_arrays(path, magic):
+    """(header, {name: memory-mapped array}) of a file written by
+    write_arrays, or (None, None) if it does not start with 'magic'."""
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            return None, None
+        size = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(size).decode('utf-8'))
+    start = _aligned(len(magic) + 8 + size)
+    arrays = {}
+    for name, dtype, count, position in header['arrays']:
+        if count == 0:
+            arrays[name] = np.zeros(0, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=start + position, shape=(count,))
+    return header, arrays
+
+
+def _aligned(n):
+    return (n + 7) // 8 * 8
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
@@ -0,0 +1,150 @@
+#################################
+# tRNA index sequences
+#################################
+
+# The tRNA used at every residue of every protein (pol.monomerTRNASequences
+# of Translation.m), computed once from a ProteinSequences and SingleAA:
+#
+#   tRNAs     the tRNA IDs of SingleAA, sorted; index i is tRNAs[i]
+#   indices   int16, the tRNA index of every residue, all proteins back to
+#             back like ProteinSequences.residues
+#   offsets   int64, protein n is indices[offsets[n]:offsets[n+1]]
+#
+# The first residue of a protein is read as 'Z' (formyl-Met).  An amino
+# acid with synonymous tRNAs in SingleAA uses them by one of the RULES:
+#
+#   rotate   in turn, one per occurrence in the protein (the default)
+#   first    always the first one listed
+#   random   uniformly at random, from a hash of the protein's sequence, the
+#            amino acid and the occurrence number, so a protein gets the
+#            same tRNAs whichever other proteins are encoded with it
+#
+# The result is kept in a file in the proteinSequences cache format, keyed
+# by the residues, SingleAA and the rule, and memory-mapped by later runs.
+# The SBML generators (TranslationSBMLgenerator.tRNA_sequence) and the
+# simulation engines (simulation/translation.py) both read it from here.
+
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+from proteinSequences import HERE, from_rows, read_arrays, write_arrays
+
+CACHE_MAGIC = b'TRNASEQ1'
+DEFAULT_CACHE = os.path.join(HERE, 'tRNA_sequences.trnacache')
+
+ROTATE = 'rotate'
+FIRST = 'first'
+RANDOM = 'random'
+RULES = [ROTATE, FIRST, RANDOM]
+
+# seed of the hash of the 'random' rule
+SEED = 0
+
+
+class TRNASequences(object):
+    """tRNA index sequences of the proteins of a ProteinSequences (see the
+    top of the file); tRNAs[self[n]] are the tRNA IDs of protein n."""
+
+    def __init__(self, tRNAs, indices, offsets):
+        self.tRNAs = list(tRNAs)
+        self.indices = indices
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, n):
+        return self.indices[self.offsets[n]:self.offsets[n + 1]]
+
+    def names(self, n):
+        return [self.tRNAs[i] for i in self[n].tolist()]
+
+
+def tRNA_names(value):
+    # an entry of SingleAA: one tRNA ID or a list of synonymous ones
+    return [value] if isinstance(value, str) else list(value)
+
+
+def trna_table(SingleAA):
+    """Sorted tRNA IDs of SingleAA and, per amino acid letter, the indices
+    of its tRNAs in that list (in SingleAA order)."""
+    tRNAs = sorted(set(name for AA in SingleAA for name in tRNA_names(SingleAA[AA])))
+    synonyms = {}
+    for AA in SingleAA:
+        synonyms[AA] = [tRNAs.index(name) for name in tRNA_names(SingleAA[AA])]
+    return tRNAs, synonyms
+
+
+def trna_sequences(proteins, SingleAA, rule=ROTATE, formyl_met=True):
+    """TRNASequences of a proteinSequences.ProteinSequences; with
+    formyl_met=False the first residues are taken as they are."""
+    if rule not in RULES:
+        raise ValueError('unknown synonymous tRNA rule %r, not one of %s' % (rule, ', '.join(RULES)))
+    tRNAs, synonyms = trna_table(SingleAA)
+    residues = np.array(proteins.residues, dtype=np.uint8)
+    offsets = np.asarray(proteins.offsets, dtype=np.int64)
+    if formyl_met:
+        residues[offsets[:-1][offsets[:-1] < offsets[1:]]] = ord('Z')
+    protein = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    if rule == RANDOM:
+        keys = np.array([zlib.crc32(residues[offsets[n]:offsets[n + 1]].tobytes()) ^ SEED
+                         for n in range(len(offsets) - 1)], dtype=np.uint64)
+    indices = np.full(len(residues), -1, dtype=np.int16)
+    for AA in synonyms:
+        where = np.flatnonzero(residues == ord(AA))
+        table = np.asarray(synonyms[AA], dtype=np.int16)
+        # occurrence number of every residue within its protein
+        first = np.searchsorted(protein[where], protein[where], side='left')
+        occurrence = np.arange(len(where)) - first
+        if rule == ROTATE:
+            choice = occurrence % len(table)
+        elif rule == FIRST:
+            choice = np.zeros(len(where), dtype=np.int64)
+        else:
+            key = (keys[protein[where]] ^ (np.uint64(ord(AA)) << np.uint64(32))
+                   ^ (occurrence.astype(np.uint64) << np.uint64(40)))
+            choice = (_mix(key) % np.uint64(len(table))).astype(np.int64)
+        indices[where] = table[choice]
+    if (indices < 0).any():
+        raise ValueError('residue without tRNA: ' + chr(residues[indices < 0][0]))
+    return TRNASequences(tRNAs, indices, offsets)
+
+
+def _mix(x):
+    # splitmix64 finalizer of a uint64 array (multiplications wrap)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def encode(sequence, SingleAA, rule=ROTATE):
+    """tRNA IDs of the residues of one sequence string, taken as it is (the
+    strings of ProteinSequences.strings('Z') already start with 'Z')."""
+    return trna_sequences(from_rows([('', len(sequence), sequence)]), SingleAA, rule, False).names(0)
+
+
+def load_trna_sequences(proteins, SingleAA, rule=ROTATE, path=DEFAULT_CACHE):
+    """trna_sequences(proteins, SingleAA, rule), from the file 'path' when it
+    was written for the same input (path=None: no file)."""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(proteins.residues).tobytes())
+    digest.update(np.ascontiguousarray(proteins.offsets, dtype=np.int64).tobytes())
+    digest.update(json.dumps([sorted((AA, tRNA_names(SingleAA[AA])) for AA in SingleAA), rule, SEED])
+                  .encode('utf-8'))
+    digest = digest.hexdigest()
+    if path is not None and os.path.exists(path):
+        header, arrays = read_arrays(path, CACHE_MAGIC)
+        if header is not None and header['source'] == digest:
+            return TRNASequences(header['tRNAs'], arrays['indices'], arrays['offsets'])
+    sequences = trna_sequences(proteins, SingleAA, rule)
+    if path is not None:
+        try:
+            write_arrays(path, CACHE_MAGIC, {'source': digest, 'tRNAs': sequences.tRNAs},
+                         [('indices', sequences.indices), ('offsets', sequences.offsets)])
+        except (IOError, OSError):
+            pass  # read-only checkout, compute again next time
+    return sequences
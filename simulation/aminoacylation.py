@@ -0,0 +1,220 @@
+#################################
+# tRNA aminoacylation process
+#################################
+
+# Python version of TranslationAlgorithm/tRNAAminoacylation.m built from the
+# SBML of createAminoAcylation.py.  As in the MATLAB process the reactions
+# are grouped by the RNA they charge (reactionModificationMatrix): MG488
+# is aminoacylated and then formylated, MG502 is glutamylated and then
+# amidotransferred, every other tRNA (and the tmRNA MG_0004) has a single
+# aminoacylation.  The intermediates (met_aminoacylated_MG488,
+# GLU_aminoacylated_MG502) are not tracked.
+#
+# For every RNA a row of
+#
+#   reactant_byproduct  RNAs x [substrates; enzymes; free RNAs]
+#
+# holds the net substrate use of its reactions, 1 / (kcat * step) for each
+# catalysing enzyme, and 1 for the RNA itself, so that the number of
+# charges the counts allow is the minimum over the row of count / entry
+# (speciesReactantByproductMatrix).  The minima are taken for all RNAs at
+# once over the CSR matrix; the charges of a round are one multinomial draw.
+
+import numpy as np
+import scipy.sparse as sp
+
+from network import _children, _elements, _find, _product, _stoichiometry
+
+# substrates left out of the limits, as in the MATLAB process
+UNLIMITED = ['H2O', 'H']
+
+# parameter units of createAminoAcylation.py, in seconds
+UNITS = {'per_second': 1.0, 'per_minute': 60.0}
+
+AMINOACYLATED = 'aminoacylated_'
+
+
+def _rna(name):
+    return name.split(AMINOACYLATED, 1)[1] if AMINOACYLATED in name else None
+
+
+def _row_min(matrix, x):
+    """min over the stored entries of every row of x[column] / entry; inf
+    for an empty row."""
+    result = np.full(matrix.shape[0], np.inf)
+    filled = np.diff(matrix.indptr) > 0
+    if filled.any():
+        ratios = x[matrix.indices] / matrix.data
+        result[filled] = np.minimum.reduceat(ratios, matrix.indptr[:-1][filled])
+    return result
+
+
+class Aminoacylation(object):
+    """State and evolve_state of tRNA aminoacylation for the SBML 'source'
+    (file or string) of createAminoAcylation.create_model.
+
+    substrates, enzymes, free_rnas and aminoacylated_rnas are numpy arrays
+    indexed like substrate_names, enzyme_names and rna_names, initialised
+    from the initial amounts of the model.  'step' is stepSizeSec and
+    'seed' seeds the numpy Generator used for every random draw."""
+
+    def __init__(self, source, step=1.0, seed=None):
+        self.step = step
+        self.rng = np.random.default_rng(seed)
+
+        species = {}
+        parameters = {}
+        reactions = []
+        for kind, element in _elements(source):
+            if kind == 'species':
+                species[element.get('id')] = int(round(float(element.get('initialAmount', '0'))))
+            elif kind == 'parameter':
+                parameters[element.get('id')] = float(element.get('value')) / \
+                    UNITS.get(element.get('units'), 1.0)
+            elif kind == 'reaction':
+                change = {}
+                for side, sign in (('listOfReactants', -1), ('listOfProducts', 1)):
+                    for reference in _children(element, side, 'speciesReference'):
+                        name = reference.get('species')
+                        change[name] = change.get(name, 0) + sign * _stoichiometry(reference)
+                rnas = [_rna(name) for name in change if _rna(name) and change[name] > 0]
+                if len(rnas) != 1:
+                    raise ValueError('reaction %s does not charge one RNA' % element.get('id'))
+                enzymes = [m.get('species') for m in _children(element, 'listOfModifiers',
+                                                               'modifierSpeciesReference')]
+                names = []
+                _product(_find(_find(element, 'kineticLaw'), 'math')[0], names, element.get('id'))
+                kcat = [parameters[name] for name in names if name in parameters]
+                if len(kcat) != 1:
+                    raise ValueError('reaction %s has no single rate constant' % element.get('id'))
+                reactions.append((element.get('id'), rnas[0], change, enzymes, kcat[0]))
+
+        self.reactions = [r[0] for r in reactions]
+        self.rna_names = []
+        self.enzyme_names = []
+        self.substrate_names = []
+        for name, rna, change, enzymes, kcat in reactions:
+            if rna not in self.rna_names:
+                self.rna_names.append(rna)
+            self.enzyme_names += [e for e in enzymes if e not in self.enzyme_names]
+        for name, rna, change, enzymes, kcat in reactions:
+            self.substrate_names += [s for s in change if s not in self.substrate_names and
+                                     s not in self.rna_names and AMINOACYLATED not in s]
+        self.kcats = np.array([r[4] for r in reactions])
+
+        # reactionStoichiometryMatrix, reactionCatalysisMatrix and
+        # reactionModificationMatrix
+        n_reactions = len(reactions)
+        self.stoichiometry = np.zeros((len(self.substrate_names), n_reactions))
+        self.catalysis = np.zeros((n_reactions, len(self.enzyme_names)))
+        self.modification = np.zeros((n_reactions, len(self.rna_names)))
+        for j, (name, rna, change, enzymes, kcat) in enumerate(reactions):
+            for s in change:
+                if s in self.substrate_names:
+                    self.stoichiometry[self.substrate_names.index(s), j] = change[s]
+            for e in enzymes:
+                self.catalysis[j, self.enzyme_names.index(e)] = 1
+            self.modification[j, self.rna_names.index(rna)] = 1
+        self._build()
+
+        self.substrates = np.array([species[s] for s in self.substrate_names], dtype=np.int64)
+        self.enzymes = np.array([species[e] for e in self.enzyme_names], dtype=np.int64)
+        self.free_rnas = np.array([species[r] for r in self.rna_names], dtype=np.int64)
+        self.aminoacylated_rnas = np.array([species.get(AMINOACYLATED + r, 0) for r in self.rna_names],
+                                           dtype=np.int64)
+
+    def _build(self):
+        # initializeSpeciesNetwork, split into the enzyme columns and the
+        # substrate and RNA columns that limit the reactions
+        enzyme_use = self.catalysis / (self.kcats * self.step)[:, None]
+        use = self.modification.T @ np.hstack([-self.stoichiometry.T, enzyme_use])
+        reactant = self.modification.T @ np.maximum(0, np.hstack([-self.stoichiometry.T, enzyme_use]))
+        n_rnas = len(self.rna_names)
+        self.reactant_byproduct = sp.csr_matrix(np.hstack([use, np.eye(n_rnas)]))
+        self.reactant = sp.csr_matrix(np.hstack([reactant, np.eye(n_rnas)]))
+
+        n_substrates = len(self.substrate_names)
+        enzyme_columns = np.arange(n_substrates, n_substrates + len(self.enzyme_names))
+        other_columns = np.array([i for i in range(self.reactant.shape[1])
+                                  if i not in enzyme_columns and
+                                  not (i < n_substrates and self.substrate_names[i] in UNLIMITED)])
+        positive = self.reactant_byproduct.maximum(0).tocsc()
+        self._reactant = sp.csr_matrix(self.reactant[:, np.r_[enzyme_columns, other_columns]])
+        self._enzyme_limits = sp.csr_matrix(positive[:, enzyme_columns])
+        self._other_limits = sp.csr_matrix(positive[:, other_columns])
+        # RNAs x limiting columns, by column for the shared-resource pass
+        self._use = sp.csc_matrix(positive[:, np.r_[enzyme_columns, other_columns]])
+        for matrix in (self._reactant, self._enzyme_limits, self._other_limits, self._use):
+            matrix.eliminate_zeros()
+        self._shared = np.flatnonzero(np.diff(self._use.indptr) > 1)
+        self._columns = (enzyme_columns, other_columns)
+
+    def substrate_index(self, name):
+        return self.substrate_names.index(name)
+
+    # checkpoint.py
+    CHECKPOINT_STATIC = ['reactions', 'rna_names', 'enzyme_names', 'substrate_names', 'kcats',
+                         'stoichiometry', 'step']
+
+    def checkpoint_state(self):
+        return {'substrates': self.substrates, 'enzymes': self.enzymes, 'free_rnas': self.free_rnas,
+                'aminoacylated_rnas': self.aminoacylated_rnas}
+
+    def restore_state(self, state):
+        for name in ['substrates', 'enzymes', 'free_rnas', 'aminoacylated_rnas']:
+            setattr(self, name, state[name])
+
+    def initialize_state(self):
+        """Two thirds of every RNA aminoacylated."""
+        total = self.free_rnas + self.aminoacylated_rnas
+        self.aminoacylated_rnas = np.ceil(2 * total / 3.0).astype(np.int64)
+        self.free_rnas = total - self.aminoacylated_rnas
+
+    def evolve_state(self):
+        if not self.free_rnas.any():
+            return
+        species = np.concatenate([self.substrates, self.enzymes, self.free_rnas]).astype(np.float64)
+        enzyme_columns, other_columns = self._columns
+
+        reaction_limits = _row_min(self._reactant, species[np.r_[enzyme_columns, other_columns]])
+        inactive = ~np.isfinite(reaction_limits) | ~(reaction_limits > 0)
+
+        fluxes = np.zeros(len(self.rna_names), dtype=np.int64)
+        while True:
+            enzyme_limits = _row_min(self._enzyme_limits, species[enzyme_columns])
+            enzyme_limits[~np.isfinite(enzyme_limits)] = 0
+            limits = np.minimum(self._stochastic_round(enzyme_limits),
+                                np.floor(_row_min(self._other_limits, species[other_columns])))
+            limits[inactive | ~np.isfinite(limits) | (limits < 1)] = 0
+            if not limits.any():
+                break
+            fired = self._share(limits.astype(np.int64), species[np.r_[enzyme_columns, other_columns]])
+            if not fired.any():
+                # nothing fits in a batch: a single reaction, as in MATLAB
+                fired = self.rng.multinomial(1, limits / limits.sum())
+            fluxes += fired
+            species -= self.reactant_byproduct.T @ fired
+
+        if not fluxes.any():
+            return
+        self.substrates += np.rint(self.stoichiometry @ (self.modification @ fluxes)).astype(np.int64)
+        self.free_rnas -= fluxes
+        self.aminoacylated_rnas += fluxes
+
+    def _share(self, fired, available):
+        """Cuts the batch 'fired' down where RNAs sharing an enzyme or
+        substrate (a column of _use) ask for more than is 'available': the
+        firings kept are a uniform sample of all requested firings."""
+        use = self._use
+        for c in self._shared:
+            rows = use.indices[use.indptr[c]:use.indptr[c + 1]]
+            coefficients = use.data[use.indptr[c]:use.indptr[c + 1]]
+            if not fired[rows].any() or coefficients @ fired[rows] <= available[c]:
+                continue
+            keep = int(max(0, available[c]) // coefficients[fired[rows] > 0].max())
+            fired[rows] = self.rng.multivariate_hypergeometric(fired[rows], min(keep, fired[rows].sum()))
+        return fired
+
+    def _stochastic_round(self, x):
+        floor = np.floor(x)
+        return floor + (self.rng.random(len(x)) < x - floor)
@@ -0,0 +1,113 @@
+#################################
+# Checkpoints of the process engines
+#################################
+
+# Writes the state of a Translation (translation.py) or Aminoacylation
+# (aminoacylation.py) to a binary file and restores it into an engine built
+# with the same proteins or SBML, so that a run continues bit for bit as if
+# it had not been stopped: every state array, the scalars and the state of
+# the numpy bit generator are stored.  The engine supplies
+#
+#   checkpoint_state()        {name: numpy array or JSON value}
+#   restore_state(state)      the inverse
+#   CHECKPOINT_STATIC         attributes fixed by the constructor; a hash of
+#                             them is stored and checked on restore
+#
+# The file is laid out like the proteinSequences cache: magic, header
+# length, JSON header (engine, hash, bit generator state, scalars and array
+# layout) and the arrays.  Arrays are cut into chunks of CHUNK bytes that
+# are zlib-compressed one by one and decompressed straight into the
+# restored array, so no uncompressed copy of a large array is made on
+# either side.  The file is written under a temporary name and renamed, so
+# a run killed while saving leaves the previous checkpoint intact.
+
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+MAGIC = b'SIMCKPT1'
+
+# uncompressed bytes per chunk
+CHUNK = 1 << 20
+
+# the state is mostly small integers and runs of zeros; level 1 gets
+# nearly all of the gain of higher levels
+COMPRESSION = 1
+
+
+def save(engine, path):
+    """Writes the state of 'engine' to 'path'."""
+    arrays = []
+    values = {}
+    for name, value in sorted(engine.checkpoint_state().items()):
+        if isinstance(value, np.ndarray):
+            arrays.append((name, np.ascontiguousarray(value)))
+        else:
+            values[name] = value
+    layout = []
+    chunks = []
+    for name, array in arrays:
+        data = memoryview(array.reshape(-1).view(np.uint8))
+        compressed = [zlib.compress(data[i:i + CHUNK], COMPRESSION) for i in range(0, len(data), CHUNK)]
+        layout.append([name, array.dtype.str, list(array.shape), [len(c) for c in compressed]])
+        chunks += compressed
+    header = json.dumps({'engine': type(engine).__name__, 'static': fingerprint(engine),
+                         'rng': engine.rng.bit_generator.state, 'values': values,
+                         'arrays': layout}).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.array([len(header)], dtype='<u8').tobytes())
+        f.write(header)
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load(engine, path):
+    """Restores the state saved in 'path' into 'engine', which must be of
+    the same class and built from the same proteins or model; returns
+    'engine'."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a checkpoint' % path)
+        size = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(size).decode('utf-8'))
+        if header['engine'] != type(engine).__name__ or header['static'] != fingerprint(engine):
+            raise ValueError('%s was written by a %s for other proteins or another model'
+                             % (path, header['engine']))
+        state = dict(header['values'])
+        for name, dtype, shape, sizes in header['arrays']:
+            array = np.empty(shape, dtype=dtype)
+            data = memoryview(array.reshape(-1).view(np.uint8))
+            position = 0
+            for n in sizes:
+                chunk = zlib.decompress(f.read(n))
+                data[position:position + len(chunk)] = chunk
+                position += len(chunk)
+            if position != len(data):
+                raise ValueError('%s: array %s is truncated' % (path, name))
+            state[name] = array
+    engine.restore_state(state)
+    engine.rng.bit_generator.state = header['rng']
+    return engine
+
+
+def fingerprint(engine):
+    """SHA-1 of the CHECKPOINT_STATIC attributes of 'engine'."""
+    digest = hashlib.sha1()
+    for name in engine.CHECKPOINT_STATIC:
+        value = getattr(engine, name)
+        digest.update(name.encode('utf-8'))
+        if isinstance(value, np.ndarray):
+            digest.update(value.dtype.str.encode('ascii'))
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(json.dumps(value).encode('utf-8'))
+    return digest.hexdigest()
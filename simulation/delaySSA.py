@@ -0,0 +1,110 @@
+#################################
+# Delay stochastic simulation
+#################################
+
+# Exact stochastic simulation of a Network (network.py) in which some
+# reactions are not random events but fire a fixed delay after the event
+# that started them, as in the delay SSA of Barrio et al. (PLoS Comput.
+# Biol. 2:e117, 2006) and the modified next reaction method of Anderson
+# (J. Chem. Phys. 127:214107, 2007).
+#
+# It is made for the reduced translation model of
+# TranslationSBMLgenerator.create_model(..., reduced=True).  There the
+# initiation of a protein takes all resources of its elongation at once and
+# produces one <protein>_elongating; the first-order reaction
+# <protein>_elongation (rate elongation_rate / L) releases them again.  A
+# delayed reaction d with a single factor s is fired here exactly 1 /
+# rates[d] seconds after every unit of s is produced, instead of after an
+# exponential waiting time; the copies of s present at the start are taken
+# to be uniformly spread over their transit.
+#
+# The kinetic law of the bulk initiation does not mention the tRNAs it
+# takes; the reactant gate of network.py keeps it from firing until all of
+# them are there.
+#
+# The other reactions run the next reaction method of nextReaction.py; a
+# completion due before the next reaction is applied first, and the
+# reactions depending on what it changed are rescaled as after any firing.
+
+import heapq
+
+import numpy as np
+
+from nextReaction import NextReactionSimulator
+
+# reactions of the reduced translation model that are delayed by default
+DELAYED_SUFFIX = '_elongation'
+
+
+class DelaySimulator(NextReactionSimulator):
+    """Runs the delay SSA on 'network' from its initial counts (or 'x0');
+    'delayed' names the delayed reactions (by default those whose ID ends
+    in DELAYED_SUFFIX).  The interface is that of
+    nextReaction.NextReactionSimulator; 'completions' counts the delayed
+    firings."""
+
+    def __init__(self, network, seed=None, x0=None, delayed=None):
+        self._build(network)
+        if delayed is None:
+            delayed = [name for name in network.reactions if name.endswith(DELAYED_SUFFIX)]
+        self.delays = {}
+        # triggers[j]: (d, n) for every delayed reaction d whose factor
+        # reaction j produces n of
+        self.triggers = [[] for j in range(network.n_reactions)]
+        producers = network.stoichiometry.tocsr()
+        index = dict((name, j) for j, name in enumerate(network.reactions))
+        for name in delayed:
+            d = index[name]
+            factors = self.factors[d]
+            if len(factors) != 1 or dict(self.changes[d]).get(factors[0], 0) >= 0 or self.rates[d] <= 0.0:
+                raise ValueError('delayed reaction %s is not a first-order reaction consuming its factor' % name)
+            s = factors[0]
+            self.delays[d] = 1.0 / self.rates[d]
+            row = slice(producers.indptr[s], producers.indptr[s + 1])
+            for j, n in zip(producers.indices[row].tolist(), producers.data[row].tolist()):
+                if n > 0:
+                    self.triggers[j].append((d, n))
+            # no longer a random event
+            self.rates[d] = 0.0
+        self.reset(seed, x0)
+
+    def reset(self, seed=None, x0=None):
+        NextReactionSimulator.reset(self, seed, x0)
+        self.completions = 0
+        self.pending = []
+        for d in sorted(self.delays):
+            s = self.factors[d][0]
+            for start in self.rng.random(self.x[s]).tolist():
+                self._schedule(d, self.t + start * self.delays[d])
+
+    def _schedule(self, d, t):
+        heapq.heappush(self.pending, (t, d))
+
+    def advance(self, t_end):
+        """Fires every reaction and completes every delayed reaction due
+        before 't_end'; the state is then the state at 't_end'."""
+        heap = self.heap
+        times = heap.times
+        x = self.x
+        pending = self.pending
+        while True:
+            j = heap.heap[0]
+            t = times[j]
+            if pending and pending[0][0] <= t:
+                t, j = pending[0]
+                if t > t_end:
+                    break
+                heapq.heappop(pending)
+                self.completions += 1
+            elif t > t_end:
+                break
+            else:
+                self.events += 1
+                for d, n in self.triggers[j]:
+                    for copy in range(n):
+                        self._schedule(d, t + self.delays[d])
+            self.t = t
+            for i, change in self.changes[j]:
+                x[i] += change
+            self._update(j, t)
+        self.t = t_end
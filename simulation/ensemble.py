@@ -0,0 +1,189 @@
+#################################
+# Ensembles of independent cells
+#################################
+
+# Runs many replicates of a stochastic simulation of one Network on a
+# process pool.  The numeric arrays of the network (network.arrays) are
+# copied once into a block of shared memory that every worker maps
+# read-only, so the pool does not hold one copy of a genome-scale network
+# per process.  Replicate i draws from the i-th child of one SeedSequence,
+# so the result does not depend on the number of processes or on the
+# order in which batches finish.
+#
+# Every worker builds its simulator once and resets it for each replicate.
+# Workers return Statistics of their batch (running moments of the
+# observed species at the sample times) instead of trajectories; the
+# batches are merged as they arrive.
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from delaySSA import DelaySimulator
+from network import Network
+from nextReaction import NextReactionSimulator
+from tauLeaping import TauLeapingSimulator
+
+SIMULATORS = {'nextReaction': NextReactionSimulator, 'tauLeaping': TauLeapingSimulator,
+              'delay': DelaySimulator}
+
+# replicates per task sent to a worker
+BATCH = 8
+
+
+class Statistics(object):
+    """Mean and variance of counts over replicates, for every sample time x
+    observed species, kept as running moments (numpy arrays, merged
+    exactly with the pairwise formulas of Chan et al.).  With
+    histograms=True the counts are also kept as exact histograms, for
+    quantiles; they grow with the number of distinct values."""
+
+    def __init__(self, times, species, histograms=False):
+        self.times = np.asarray(times)
+        self.species = list(species)
+        self.n = 0
+        shape = (len(self.times), len(self.species))
+        self._mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+        self.histograms = [[{} for s in self.species] for t in self.times] if histograms else None
+
+    def add(self, counts):
+        """Adds one replicate: counts[time, species]."""
+        counts = np.asarray(counts, dtype=np.float64)
+        self.n += 1
+        delta = counts - self._mean
+        self._mean += delta / self.n
+        self._m2 += delta * (counts - self._mean)
+        if self.histograms is not None:
+            for t, row in enumerate(np.asarray(counts, dtype=np.int64).tolist()):
+                for s, value in enumerate(row):
+                    histogram = self.histograms[t][s]
+                    histogram[value] = histogram.get(value, 0) + 1
+
+    def merge(self, other):
+        if other.n:
+            n = self.n + other.n
+            delta = other._mean - self._mean
+            self._m2 += other._m2 + delta ** 2 * (self.n * other.n / n)
+            self._mean += delta * (other.n / n)
+            self.n = n
+        if self.histograms is not None:
+            for t in range(len(self.times)):
+                for s in range(len(self.species)):
+                    histogram = self.histograms[t][s]
+                    for value, count in other.histograms[t][s].items():
+                        histogram[value] = histogram.get(value, 0) + count
+        return self
+
+    def mean(self):
+        return self._mean.copy()
+
+    def variance(self):
+        """Sample variance (ddof=1); 0 for a single replicate."""
+        if self.n < 2:
+            return np.zeros_like(self._m2)
+        return self._m2 / (self.n - 1)
+
+    def quantile(self, q):
+        """The smallest count with at least a fraction 'q' of the
+        replicates at or below it (needs histograms=True)."""
+        if self.histograms is None:
+            raise ValueError('quantiles need the histograms; run with histograms=True')
+
+        def quantile(h):
+            h = np.array(sorted(h.items()), dtype=np.float64).reshape(-1, 2)
+            cumulative = np.cumsum(h[:, 1])
+            return h[np.searchsorted(cumulative, q * cumulative[-1] - 1e-9), 0]
+        return np.array([[quantile(h) for h in row] for row in self.histograms])
+
+
+#########################################################################
+# Shared network
+#########################################################################
+
+def share(network):
+    """Copies network.arrays() into one new SharedMemory block; returns it
+    and the layout [(key, dtype, shape, offset)] to attach() with."""
+    arrays = network.arrays()
+    layout = []
+    offset = 0
+    for key in sorted(arrays):
+        array = np.ascontiguousarray(arrays[key])
+        offset = (offset + 63) // 64 * 64
+        layout.append((key, array.dtype.str, array.shape, offset))
+        offset += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for key, dtype, shape, start in layout:
+        view = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)
+        view[...] = arrays[key]
+    return block, layout
+
+
+def attach(name, layout, species, reactions, buffered=()):
+    """The Network in SharedMemory 'name', as read-only views; returns
+    (block, network), and the block must be kept open while the network
+    is used."""
+    block = shared_memory.SharedMemory(name=name)
+    arrays = {}
+    for key, dtype, shape, start in layout:
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)
+        arrays[key].flags.writeable = False
+    return block, Network.from_arrays(species, reactions, arrays, buffered)
+
+
+_worker = {}
+
+
+def _initialize(name, layout, species, reactions, buffered, method, options):
+    # the network and the simulator are built once per worker; every
+    # replicate resets the simulator with its own seed
+    _worker['block'], network = attach(name, layout, species, reactions, buffered)
+    _worker['simulator'] = SIMULATORS[method](network, **options)
+
+
+def _run_batch(task):
+    seeds, t_end, dt, observe, histograms = task
+    simulator = _worker['simulator']
+    statistics = None
+    for seed in seeds:
+        simulator.reset(seed)
+        times, counts = simulator.run(t_end, dt=dt, observe=observe)
+        if statistics is None:
+            statistics = Statistics(times, observe, histograms)
+        statistics.add(counts)
+    return statistics
+
+
+def run_ensemble(network, replicates, t_end, dt=None, observe=None, method='nextReaction', seed=None,
+                 processes=None, batch=BATCH, progress=None, histograms=False, **options):
+    """Simulates 'replicates' independent cells of 'network' with the
+    simulator 'method' (a key of SIMULATORS, built with 'options') and
+    returns the merged Statistics of the species named in 'observe'
+    (required: all species of a genome-scale network would be far too
+    many) sampled as by run(t_end, dt); histograms=True keeps the
+    histograms needed for quantiles.  'progress(done, total)' is called
+    as batches arrive."""
+    if observe is None:
+        raise ValueError('run_ensemble needs the list of species to observe')
+    observe = list(observe)
+    children = np.random.SeedSequence(seed).spawn(replicates)
+    tasks = [(children[i:i + batch], t_end, dt, observe, histograms)
+             for i in range(0, replicates, batch)]
+    block, layout = share(network)
+    try:
+        with multiprocessing.get_context().Pool(
+                processes, _initialize,
+                (block.name, layout, network.species, network.reactions, network.buffered,
+                 method, options)) as pool:
+            total = None
+            done = 0
+            for statistics in pool.imap_unordered(_run_batch, tasks):
+                total = statistics if total is None else total.merge(statistics)
+                done += statistics.n
+                if progress:
+                    progress(done, replicates)
+        return total
+    finally:
+        block.close()
+        block.unlink()
@@ -0,0 +1,84 @@
+#################################
+# Weighted sampling with a Fenwick tree
+#################################
+
+# A Fenwick (binary indexed) tree over n non-negative weights: tree[i]
+# (1-based) holds the sum of the weights in (i - lowbit(i), i], so a prefix
+# sum, a weight change and the search for the item containing a given
+# point of [0, total) each touch O(log n) entries.  The searches and
+# updates below run for a whole array of points or items at once, one
+# numpy operation per level of the tree.
+#
+# take() is randsample(n, 1, true, weights) repeated k times with the
+# weight of every drawn item decremented by one, as the initiation of
+# Translation.m binds ribosomes to mRNA copies; for integer weights that is
+# k units drawn without replacement, which is what it does in one batch.
+
+import numpy as np
+
+
+class FenwickTree(object):
+    """Fenwick tree over the weights 'weights' (int64 or float64)."""
+
+    def __init__(self, weights):
+        weights = np.asarray(weights)
+        self.n = len(weights)
+        cumulative = np.zeros(self.n + 1, dtype=weights.dtype)
+        np.cumsum(weights, out=cumulative[1:])
+        index = np.arange(1, self.n + 1)
+        self.tree = np.zeros(self.n + 1, dtype=weights.dtype)
+        self.tree[1:] = cumulative[index] - cumulative[index - (index & -index)]
+        self._top = 1 << max(0, self.n.bit_length() - 1)
+
+    def total(self):
+        return self.prefix(self.n)
+
+    def prefix(self, i):
+        """Sum of the first 'i' weights."""
+        result = self.tree[0]
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def add(self, items, deltas):
+        """Adds 'deltas' to the weights of 'items' (arrays, or scalars);
+        repeated items add up."""
+        items = np.atleast_1d(np.asarray(items, dtype=np.int64)) + 1
+        deltas = np.broadcast_to(np.asarray(deltas, dtype=self.tree.dtype), items.shape)
+        while len(items):
+            np.add.at(self.tree, items, deltas)
+            items = items + (items & -items)
+            inside = items <= self.n
+            items, deltas = items[inside], deltas[inside]
+
+    def find(self, points):
+        """The item containing each of 'points' in [0, total): the smallest
+        i with prefix(i + 1) > point."""
+        remaining = np.array(points, dtype=self.tree.dtype, ndmin=1)
+        position = np.zeros(len(remaining), dtype=np.int64)
+        step = self._top
+        while step:
+            following = position + step
+            fits = following <= self.n
+            fits[fits] &= self.tree[following[fits]] <= remaining[fits]
+            position[fits] = following[fits]
+            remaining[fits] -= self.tree[following[fits]]
+            step >>= 1
+        return position
+
+    def sample(self, rng, size):
+        """'size' items drawn with replacement, with probability
+        proportional to their weights."""
+        return self.find(rng.random(size) * self.total())
+
+    def take(self, k, rng):
+        """'k' items, in draw order, each drawn in proportion to the weights
+        left after decrementing the weight of every earlier draw by one
+        (integer weights, k <= total); the weights are decremented."""
+        total = int(self.total())
+        if k > total:
+            raise ValueError('cannot take %d units of a total weight of %d' % (k, total))
+        items = self.find(rng.choice(total, k, replace=False))
+        self.add(items, -1)
+        return items
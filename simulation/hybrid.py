@@ -0,0 +1,184 @@
+#################################
+# Hybrid stochastic/deterministic simulation
+#################################
+
+# Splits the species of a Network (network.py) by abundance.  A species
+# with at least 'threshold' copies is continuous (it becomes discrete again
+# below threshold / 2, so that counts near the threshold do not flip every
+# step); the others are discrete.  A reaction that changes only continuous
+# species is fast and is integrated as a chemical Langevin equation (or
+# deterministically with noise=False); the other reactions are slow and
+# fire one by one, exactly, with the next reaction method.
+#
+# Time advances in intervals short enough that no continuous count changes
+# by more than a fraction epsilon.  Within an interval the slow reactions
+# see the continuous counts of its start: firing a reaction updates only
+# the reactions that depend on the discrete species it changes, so GTP,
+# H2O, ATP and the other metabolites, changed by nearly every reaction, no
+# longer make every firing touch every reaction.  At the end of the
+# interval the fast reactions are applied, all propensities are recomputed
+# and the partition is checked again.
+
+import numpy as np
+import scipy.sparse as sp
+
+from nextReaction import IndexedHeap, crossed
+
+THRESHOLD = 1000
+EPSILON = 0.03
+
+# longest interval between propensity refreshes, seconds
+INTERVAL = 1.0
+
+
+class HybridSimulator(object):
+    """Hybrid simulation of 'network' from its initial counts (or 'x0');
+    'seed' seeds the numpy Generator that supplies all random numbers.
+    The interface is that of nextReaction.NextReactionSimulator; counts
+    of continuous species are real numbers."""
+
+    def __init__(self, network, seed=None, x0=None, threshold=THRESHOLD, epsilon=EPSILON,
+                 interval=INTERVAL, noise=True):
+        self.network = network
+        self.rng = np.random.default_rng(seed)
+        self.t = 0.0
+        self.events = 0
+        self.intervals = 0
+        self.partitions = 0
+        self.x = np.array(network.x0 if x0 is None else x0, dtype=np.float64)
+        self.threshold = threshold
+        self.epsilon = epsilon
+        self.interval = interval
+        self.noise = noise
+
+        self.stoichiometry = network.stoichiometry.astype(np.float64).tocsc()
+        self._changes = (network.stoichiometry != 0).astype(np.int64).tocsc()
+        self._factors = (network.factors() != 0).astype(np.int64).tocsr()
+        # the reactant gates of network.py
+        self.reactants = network.reactants()
+        self.gates = network.gates()
+        ptr = network.factor_ptr
+        species = network.factor_species.tolist()
+        self.rates = network.rates.tolist()
+        self.factors = [species[ptr[j]:ptr[j + 1]] for j in range(network.n_reactions)]
+        s = self.stoichiometry
+        indices, data = s.indices.tolist(), s.data.tolist()
+        self.changes = [list(zip(indices[s.indptr[j]:s.indptr[j + 1]], data[s.indptr[j]:s.indptr[j + 1]]))
+                        for j in range(network.n_reactions)]
+        self.continuous = self.x >= threshold
+        self._partition()
+
+    def _partition(self):
+        """Fast and slow reactions, and the dependency graph of the slow
+        reactions through discrete species, for self.continuous."""
+        self.partitions += 1
+        discrete = (~self.continuous).astype(np.int64)
+        touched = np.asarray(self._changes.T @ discrete).ravel()
+        self.fast = touched == 0
+        self.slow = np.flatnonzero(~self.fast)
+        # position of every reaction in self.slow, -1 for fast ones
+        self._slow_position = np.full(len(self.fast), -1, dtype=np.int64)
+        self._slow_position[self.slow] = np.arange(len(self.slow))
+        self.x[~self.continuous] = np.rint(self.x[~self.continuous])
+
+        # slow reaction k depends on slow reaction j if j changes a discrete
+        # factor of k
+        changes = self._changes[:, self.slow].T.tocsr().multiply(discrete[None, :]).tocsr()
+        graph = (changes @ self._factors[:, self.slow]).tocsr()
+        graph = graph + sp.identity(len(self.slow), dtype=np.int64, format='csr')
+        targets = graph.indices.tolist()
+        self.dependents = [targets[graph.indptr[k]:graph.indptr[k + 1]] for k in range(len(self.slow))]
+
+    def run(self, t_end, dt=None, observe=None):
+        """Simulates until time 't_end' and returns (times, counts) like
+        NextReactionSimulator.run."""
+        if observe is None:
+            columns = np.arange(self.network.n_species)
+        else:
+            columns = np.array([self.network.index(name) for name in observe], dtype=np.int64)
+        if dt is None:
+            samples = np.array([t_end])
+        else:
+            samples = np.append(np.arange(self.t, t_end, dt), t_end)
+        counts = np.empty((len(samples), len(columns)))
+        for i, sample in enumerate(samples):
+            self.advance(sample)
+            counts[i] = self.x[columns]
+        return samples, counts
+
+    def advance(self, t_end):
+        while self.t < t_end:
+            a = self.network.propensities(self.x)
+            delta = min(t_end - self.t, self.interval, self._limit(a))
+            self._slow(a, self.t + delta)
+            self._fast(a, delta)
+            self.t += delta
+            self.intervals += 1
+
+            continuous = np.where(self.continuous, self.x >= self.threshold / 2.0, self.x >= self.threshold)
+            if (continuous != self.continuous).any():
+                self.continuous = continuous
+                self._partition()
+        self.t = max(self.t, t_end)
+
+    def _limit(self, a):
+        # longest interval over which the expected change of every
+        # continuous count stays below epsilon times the count
+        if not self.continuous.any():
+            return np.inf
+        drift = np.abs(self.stoichiometry @ a)[self.continuous]
+        with np.errstate(divide='ignore'):
+            return (self.epsilon * self.x[self.continuous] / drift).min()
+
+    def _fast(self, a, delta):
+        if not self.fast.any():
+            return
+        mean = a[self.fast] * delta
+        firings = mean + np.sqrt(mean) * self.rng.standard_normal(len(mean)) if self.noise else mean
+        self.x += self.stoichiometry[:, self.fast] @ firings
+        np.maximum(self.x, 0.0, out=self.x)
+
+    def _slow(self, a, t_end):
+        # next reaction method over the slow reactions until t_end
+        slow = self.slow.tolist()
+        if not slow:
+            return
+        rates, factors, changes, dependents = self.rates, self.factors, self.changes, self.dependents
+        reactants, gates, position = self.reactants, self.gates, self._slow_position.tolist()
+        x = self.x.tolist()
+        propensity = a[self.slow].tolist()
+        draws = self.rng.standard_exponential(len(slow))
+        with np.errstate(divide='ignore'):
+            heap = IndexedHeap((self.t + draws / a[self.slow]).tolist())
+        times = heap.times
+        exponentials = []
+        while True:
+            k = heap.heap[0]
+            t = times[k]
+            if t > t_end:
+                break
+            for i, change in changes[slow[k]]:
+                x[i] += change
+            self.events += 1
+            affected = dependents[k]
+            gated = [position[r] for r in crossed(gates, changes[slow[k]], x) if position[r] >= 0]
+            if gated:
+                affected = affected + gated
+            for m in affected:
+                value = rates[slow[m]]
+                for i in factors[slow[m]]:
+                    value *= x[i]
+                for i, n in reactants[slow[m]]:
+                    if x[i] < n:
+                        value = 0.0
+                old = propensity[m]
+                propensity[m] = value
+                if value <= 0.0:
+                    heap.update(m, np.inf)
+                elif m != k and old > 0.0:
+                    heap.update(m, t + (old / value) * (times[m] - t))
+                else:
+                    if not exponentials:
+                        exponentials = self.rng.standard_exponential(4096).tolist()
+                    heap.update(m, t + exponentials.pop() / value)
+        self.x = np.array(x)
@@ -0,0 +1,384 @@
+#################################
+# Reaction networks for simulation
+#################################
+
+# The simulation engines in this directory do not work on libSBML objects.
+# load_network reads the SBML written by
+# modelGeneration/TranslationSBMLgenerator.py and createAminoAcylation.py
+# with a streaming XML parser (the full translation model does not fit in
+# a libSBML document) and compiles it into flat arrays:
+#
+#   stoichiometry   species x reactions, scipy.sparse CSC, net change
+#   rates           float64, constant factor of each kinetic law
+#   factor_ptr      int64, reaction j multiplies the counts of
+#   factor_species  int32, factor_species[factor_ptr[j]:factor_ptr[j+1]]
+#
+# Every kinetic law of these models is a pure mass-action product such as
+# 'k * GTP * GTP * MG_089_MONOMER * MG_451_MONOMER * MG_001_MONOMER_p9', so
+# the propensity of reaction j is rates[j] times the product of its
+# factors.  A repeated species is repeated in factor_species; as in the SBML
+# the product uses the count itself, not the falling factorial.
+#
+# Several laws do not mention everything their reaction consumes (the
+# elongation laws omit the aminoacylated tRNA, release takes two
+# RF1_30S_50S under a linear law, the bulk initiation of reduced models
+# takes a whole protein's tRNAs).  The stochastic engines therefore gate
+# every propensity on its reactants: it is zero while a species is below
+# the amount the reaction consumes (its negative net stoichiometry), so no
+# count can go negative.  A consumed species that is not a factor would
+# make the dependency graph dense (every elongation of every protein
+# consumes one of a few dozen tRNAs), but it changes the gate only when
+# its count crosses the amount consumed; gates() lists these thresholds by
+# species, and the engines look up the crossed ones after each firing.
+
+import io
+import os
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import scipy.sparse as sp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+MATHML = '{http://www.w3.org/1998/Math/MathML}'
+ARRAYS_NS = 'http://www.sbml.org/sbml/level3/version1/arrays/version1'
+
+# high-copy small molecules of the two models; passing them as 'buffered'
+# keeps their counts fixed, which the README asks for water and which keeps
+# the reaction dependency graph sparse
+METABOLITES = ['H2O', 'H', 'PI', 'PPI', 'ATP', 'ADP', 'AMP', 'GTP', 'GDP']
+
+# a dependency graph with more entries than this is refused (see dependencies)
+MAX_DEPENDENCIES = 50000000
+
+
+class Network(object):
+    """A mass-action reaction network as flat arrays (see the top of the
+    file).  'buffered' lists species whose counts never change: their rows
+    of the stoichiometry are zero, but they still enter the propensities."""
+
+    def __init__(self, species, x0, reactions, stoichiometry, rates, factor_ptr, factor_species,
+                 buffered=()):
+        self.species = list(species)
+        self.x0 = np.asarray(x0, dtype=np.int64)
+        self.reactions = list(reactions)
+        self.stoichiometry = sp.csc_matrix(stoichiometry, dtype=np.int64)
+        self.rates = np.asarray(rates, dtype=np.float64)
+        self.factor_ptr = np.asarray(factor_ptr, dtype=np.int64)
+        self.factor_species = np.asarray(factor_species, dtype=np.int32)
+        self.buffered = list(buffered)
+        self._index = dict((self.species[i], i) for i in range(len(self.species)))
+        # species x reactions CSC, entry = amount consumed
+        consumed = (-self.stoichiometry).maximum(0).tocsc()
+        consumed.eliminate_zeros()
+        self.consumed = consumed
+        self._consuming = np.repeat(np.arange(self.n_reactions), np.diff(consumed.indptr))
+
+    @property
+    def n_species(self):
+        return len(self.species)
+
+    @property
+    def n_reactions(self):
+        return len(self.reactions)
+
+    def index(self, name):
+        return self._index[name]
+
+    def propensities(self, x, gated=True):
+        """Propensities of all reactions for the counts 'x'; with gated=True
+        zero for the reactions whose reactants are short (see the top of
+        the file)."""
+        x = np.asarray(x, dtype=np.float64)
+        values = np.append(x[self.factor_species], 1.0)
+        products = np.multiply.reduceat(values, self.factor_ptr[:-1])
+        products[self.factor_ptr[:-1] == self.factor_ptr[1:]] = 1.0
+        a = self.rates * products
+        if gated:
+            a[self._consuming[x[self.consumed.indices] < self.consumed.data]] = 0.0
+        return a
+
+    def reactants(self):
+        """[(species, amount consumed), ...] of every reaction."""
+        c = self.consumed
+        indices, data = c.indices.tolist(), c.data.tolist()
+        return [list(zip(indices[c.indptr[j]:c.indptr[j + 1]], data[c.indptr[j]:c.indptr[j + 1]]))
+                for j in range(self.n_reactions)]
+
+    def factors(self):
+        """factor incidence as species x reactions CSC, entry = multiplicity"""
+        counts = np.diff(self.factor_ptr)
+        columns = np.repeat(np.arange(self.n_reactions), counts)
+        return sp.csc_matrix((np.ones(len(self.factor_species), dtype=np.int64),
+                              (self.factor_species, columns)),
+                             shape=(self.n_species, self.n_reactions))
+
+    def gates(self):
+        """Per species None, or (amounts, reactions): the reactions that
+        consume it without having it as a factor, sorted by the amount
+        consumed.  Their gate opens or closes when the count crosses that
+        amount."""
+        gates = [None] * self.n_species
+        c = self.consumed
+        for j in range(self.n_reactions):
+            factors = set(self.factor_species[self.factor_ptr[j]:self.factor_ptr[j + 1]].tolist())
+            row = slice(c.indptr[j], c.indptr[j + 1])
+            for i, n in zip(c.indices[row].tolist(), c.data[row].tolist()):
+                if i not in factors:
+                    if gates[i] is None:
+                        gates[i] = []
+                    gates[i].append((n, j))
+        for i in range(self.n_species):
+            if gates[i] is not None:
+                gates[i].sort()
+                gates[i] = ([n for n, j in gates[i]], [j for n, j in gates[i]])
+        return gates
+
+    def dependencies(self, limit=MAX_DEPENDENCIES):
+        """Reaction dependency graph as reactions x reactions CSR: row j
+        lists the reactions whose propensity changes when j fires (j
+        itself included).  Unbuffered metabolites that appear in most
+        reactions make the graph dense; it is refused with a ValueError
+        naming them when it would have more than 'limit' entries."""
+        changes = (self.stoichiometry != 0).astype(np.int64).tocsr()
+        factors = (self.factors() != 0).astype(np.int64).tocsr()
+        size = np.diff(changes.indptr) * np.diff(factors.indptr)
+        if size.sum() > limit:
+            worst = np.argsort(-size)[:5]
+            raise ValueError('dependency graph too large (%d entries); buffer the high-degree species %s'
+                             % (size.sum(), ', '.join(self.species[i] for i in worst if size[i] > 0)))
+        graph = (changes.T.tocsr() * factors).tocsr()
+        graph = graph + sp.identity(self.n_reactions, dtype=np.int64, format='csr')
+        graph.sort_indices()
+        return graph
+
+    def arrays(self):
+        """The numeric part of the network as a dict of flat arrays (the
+        names go separately), e.g. to place it in shared memory."""
+        s = self.stoichiometry
+        return {'x0': self.x0, 'rates': self.rates, 'factor_ptr': self.factor_ptr,
+                'factor_species': self.factor_species, 'stoich_data': s.data,
+                'stoich_indices': s.indices, 'stoich_indptr': s.indptr}
+
+    @classmethod
+    def from_arrays(cls, species, reactions, arrays, buffered=()):
+        s = sp.csc_matrix((arrays['stoich_data'], arrays['stoich_indices'], arrays['stoich_indptr']),
+                          shape=(len(species), len(reactions)), copy=False)
+        return cls(species, arrays['x0'], reactions, s, arrays['rates'], arrays['factor_ptr'],
+                   arrays['factor_species'], buffered)
+
+
+#########################################################################
+# Loading SBML
+#########################################################################
+
+def load_network(sources, buffered=(), initial=None):
+    """Compiles one or more SBML models ('sources': file names or XML
+    strings) into a single Network.  Species with the same ID are the same
+    species (the tRNAs, GTP, H2O, ... shared by translation and
+    aminoacylation) and take the initial amount of the first model that
+    declares them; 'initial' ({ID: count}) overrides initial amounts.
+    Species that are constant or boundary conditions in the SBML are
+    buffered as well.  A 'buffered' name the sources do not declare is an
+    error, except for METABOLITES missing from a model without them, as
+    long as some of the requested names are found."""
+    if isinstance(sources, str) or not hasattr(sources, '__iter__'):
+        sources = [sources]
+    species = []
+    index = {}
+    x0 = []
+    requested = list(buffered)
+    buffered = list(buffered)
+    reactions = []
+    rates = []
+    factor_ptr = [0]
+    factor_species = []
+    rows = []
+    columns = []
+    values = []
+
+    def species_index(name):
+        if name not in index:
+            raise ValueError('reaction refers to undeclared species ' + name)
+        return index[name]
+
+    for source in sources:
+        parameters = {}
+        for kind, element in _elements(source):
+            if kind == 'species':
+                name = element.get('id')
+                if name in index:
+                    continue
+                index[name] = len(species)
+                species.append(name)
+                x0.append(int(round(float(element.get('initialAmount', '0')))))
+                if element.get('boundaryCondition') == 'true' or element.get('constant') == 'true':
+                    buffered.append(name)
+            elif kind == 'parameter':
+                parameters[element.get('id')] = float(element.get('value', 'nan'))
+            elif kind == 'reaction':
+                j = len(reactions)
+                reactions.append(element.get('id'))
+                change = {}
+                for side, sign in (('listOfReactants', -1), ('listOfProducts', 1)):
+                    for reference in _children(element, side, 'speciesReference'):
+                        s = species_index(reference.get('species'))
+                        change[s] = change.get(s, 0) + sign * _stoichiometry(reference)
+                for s in sorted(change):
+                    if change[s] != 0:
+                        rows.append(s)
+                        columns.append(j)
+                        values.append(change[s])
+                law = _find(element, 'kineticLaw')
+                math = None if law is None else law.find(MATHML + 'math')
+                if math is None or len(math) != 1:
+                    raise ValueError('reaction %s has no kinetic law' % reactions[-1])
+                local = dict(parameters)
+                for p in _children(law, 'listOfLocalParameters', 'localParameter'):
+                    local[p.get('id')] = float(p.get('value', 'nan'))
+                names = []
+                rate = _product(math[0], names, reactions[-1])
+                for name in names:
+                    if name in index:
+                        factor_species.append(index[name])
+                    elif name in local:
+                        rate *= local[name]
+                    else:
+                        raise ValueError('unknown symbol %s in kinetic law of %s' % (name, reactions[-1]))
+                rates.append(rate)
+                factor_ptr.append(len(factor_species))
+
+    if initial:
+        for name in initial:
+            x0[index[name]] = int(initial[name])
+    unknown = [name for name in requested if name not in index]
+    if unknown and (len(unknown) == len(requested) or set(unknown) - set(METABOLITES)):
+        raise ValueError('buffered species not in the model: ' + ', '.join(unknown))
+    # METABOLITES of other models (e.g. ATP without aminoacylation) are ignored
+    buffered = [name for name in sorted(set(buffered), key=buffered.index) if name in index]
+    keep = np.ones(len(values), dtype=bool)
+    for name in buffered:
+        keep &= np.asarray(rows, dtype=np.int64) != index[name]
+    stoichiometry = sp.csc_matrix((np.asarray(values, dtype=np.int64)[keep],
+                                   (np.asarray(rows, dtype=np.int64)[keep],
+                                    np.asarray(columns, dtype=np.int64)[keep])),
+                                  shape=(len(species), len(reactions)))
+    return Network(species, x0, reactions, stoichiometry, rates, factor_ptr, factor_species, buffered)
+
+
+def translation_network(names, lengths, sequences, buffered=(), initial=None, sources=(), **options):
+    """Network of TranslationSBMLgenerator.create_model for the given
+    proteins (the create_model 'options', streamed through a temporary
+    file), followed by any further 'sources' such as
+    aminoacylation_model().  Compact IDs are refused: the species would
+    not match 'buffered', 'initial' or the species of the other sources."""
+    generator = _generator('TranslationSBMLgenerator')
+    if options.get('arrays'):
+        raise ValueError('arrays models cannot be simulated; use the default or chunked output')
+    if options.get('compact_ids'):
+        raise ValueError('translation_network does not take compact_ids; write the model with '
+                         'create_model and pass compact IDs to load_network')
+    handle, filename = tempfile.mkstemp(suffix='.xml')
+    os.close(handle)
+    try:
+        options['stream'] = True
+        generator.create_model(names, lengths, sequences, filename, **options)
+        return load_network([filename] + list(sources), buffered, initial)
+    finally:
+        os.remove(filename)
+
+
+def aminoacylation_model():
+    """The SBML of createAminoAcylation.create_model as a string."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import createAminoAcylation
+    return createAminoAcylation.create_model()
+
+
+def aminoacylation_network(buffered=(), initial=None):
+    return load_network([aminoacylation_model()], buffered, initial)
+
+
+def _generator(name):
+    path = os.path.join(ROOT, 'modelGeneration')
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return __import__(name)
+
+
+def _elements(source):
+    """Yields ('species' | 'parameter' | 'reaction', element) of an SBML
+    file or string, freeing every element once it has been handled."""
+    if source.lstrip().startswith('<'):
+        source = io.BytesIO(source.encode('utf-8'))
+    stack = []
+    for event, element in ET.iterparse(source, events=('start', 'end', 'start-ns')):
+        if event == 'start-ns':
+            if element[1] == ARRAYS_NS:
+                raise ValueError('models using the SBML arrays package cannot be simulated')
+        elif event == 'start':
+            stack.append(element)
+        else:
+            stack.pop()
+            tag = element.tag.rsplit('}', 1)[-1]
+            # only elements directly inside a <listOf...> of the model
+            if len(stack) == 3 and tag in ('species', 'parameter', 'reaction'):
+                yield tag, element
+                stack[-1].remove(element)
+
+
+def _find(element, tag):
+    for child in element:
+        if child.tag.rsplit('}', 1)[-1] == tag:
+            return child
+    return None
+
+
+def _children(element, listOf, tag):
+    parent = _find(element, listOf)
+    if parent is None:
+        return []
+    return [child for child in parent if child.tag.rsplit('}', 1)[-1] == tag]
+
+
+def _stoichiometry(reference):
+    # unset stoichiometry is read as 1, as libSBML does for these models
+    value = reference.get('stoichiometry')
+    if value is None or value.lower() == 'nan':
+        return 1
+    if float(value) != int(float(value)):
+        raise ValueError('non-integer stoichiometry ' + value)
+    return int(float(value))
+
+
+def _product(node, names, reaction):
+    """Appends the identifiers of the MathML product 'node' to 'names' and
+    returns the product of its numbers."""
+    tag = node.tag[len(MATHML):]
+    if tag == 'ci':
+        names.append(node.text.strip())
+        return 1.0
+    if tag == 'cn':
+        text = [t.strip() for t in node.itertext() if t.strip()]
+        if node.get('type') == 'e-notation':
+            return float(text[0]) * 10.0 ** float(text[1])
+        if node.get('type') == 'rational':
+            return float(text[0]) / float(text[1])
+        return float(text[0])
+    if tag == 'apply' and node[0].tag == MATHML + 'times':
+        value = 1.0
+        for child in node[1:]:
+            value *= _product(child, names, reaction)
+        return value
+    if tag == 'apply' and node[0].tag == MATHML + 'power' and node[2].tag == MATHML + 'cn':
+        power = _product(node[2], [], reaction)
+        if power == int(power) and power >= 0:
+            value = 1.0
+            for i in range(int(power)):
+                value *= _product(node[1], names, reaction)
+            return value
+    raise ValueError('kinetic law of %s is not a mass-action product' % reaction)
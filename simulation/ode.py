@@ -0,0 +1,112 @@
+#################################
+# Deterministic (ODE) simulation
+#################################
+
+# Integrates the reaction rate equations dx/dt = S a(x) of a Network
+# (network.py) with a stiff solver.  The kinetic laws are mass-action
+# products a_j = rates[j] * prod(x[factors of j]), so the Jacobian of the
+# propensities is known exactly: d a_j / d x_i is rates[j] times the
+# product of the other factors, summed over the occurrences of i.  Its
+# pattern (reaction j, factor i) is fixed, so it is a CSR matrix whose data
+# alone are recomputed, and the Jacobian of the system is the sparse
+# product S * da/dx.  For the elongation chains every row has a handful of
+# entries, which keeps the linear algebra of BDF sparse as well.
+#
+# Counts are real numbers here; buffered species stay constant.  The rate
+# equations use the plain mass-action products, without the reactant gate
+# of the stochastic engines (network.py), which would make them
+# discontinuous.
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.integrate import solve_ivp
+
+METHOD = 'BDF'
+RTOL = 1e-6
+ATOL = 1e-6
+
+
+class OdeSimulator(object):
+    """Deterministic simulation of 'network' from its initial counts (or
+    'x0') with solve_ivp 'method' (a stiff one: BDF, Radau or LSODA).  The
+    interface is that of nextReaction.NextReactionSimulator, with
+    float64 counts."""
+
+    def __init__(self, network, x0=None, method=METHOD, rtol=RTOL, atol=ATOL):
+        self.network = network
+        self.t = 0.0
+        self.x = np.array(network.x0 if x0 is None else x0, dtype=np.float64)
+        self.method = method
+        self.rtol = rtol
+        self.atol = atol
+        self.evaluations = 0
+
+        self.stoichiometry = network.stoichiometry.astype(np.float64).tocsr()
+        ptr = network.factor_ptr
+        order = np.diff(ptr)
+        # position of every factor occurrence within its reaction
+        self._reaction = np.repeat(np.arange(network.n_reactions), order)
+        self._position = np.arange(len(network.factor_species)) - ptr[self._reaction]
+        self._order = order
+        self._max_order = int(order.max()) if len(order) else 0
+        pattern = sp.csr_matrix((np.ones(len(network.factor_species)),
+                                 (self._reaction, network.factor_species)),
+                                shape=(network.n_reactions, network.n_species))
+        pattern.sum_duplicates()
+        self._pattern = pattern
+        # entry of the pattern each factor occurrence adds to
+        self._entry = self._locate(pattern, self._reaction, network.factor_species)
+
+    @staticmethod
+    def _locate(matrix, rows, columns):
+        keys = np.repeat(np.arange(matrix.shape[0], dtype=np.int64), np.diff(matrix.indptr)) * matrix.shape[1] + \
+            matrix.indices
+        return np.searchsorted(keys, np.asarray(rows, dtype=np.int64) * matrix.shape[1] + columns)
+
+    def rhs(self, t, x):
+        self.evaluations += 1
+        return self.stoichiometry @ self.network.propensities(x, gated=False)
+
+    def propensity_jacobian(self, x):
+        """d a / d x as a reactions x species CSR matrix."""
+        network = self.network
+        ptr = network.factor_ptr
+        species = network.factor_species
+        others = np.repeat(network.rates, self._order)
+        for q in range(self._max_order):
+            # multiply in the q-th factor of the reaction, unless it is
+            # the occurrence being differentiated
+            has = (q < self._order[self._reaction]) & (q != self._position)
+            others[has] *= x[species[ptr[self._reaction[has]] + q]]
+        data = np.zeros(self._pattern.nnz)
+        np.add.at(data, self._entry, others)
+        return sp.csr_matrix((data, self._pattern.indices, self._pattern.indptr), shape=self._pattern.shape)
+
+    def jacobian(self, t, x):
+        return (self.stoichiometry @ self.propensity_jacobian(x)).tocsc()
+
+    def run(self, t_end, dt=None, observe=None):
+        """Integrates until time 't_end' and returns (times, counts) like
+        NextReactionSimulator.run."""
+        if observe is None:
+            columns = np.arange(self.network.n_species)
+        else:
+            columns = np.array([self.network.index(name) for name in observe], dtype=np.int64)
+        if dt is None:
+            samples = np.array([t_end])
+        else:
+            samples = np.append(np.arange(self.t, t_end, dt), t_end)
+        counts = np.empty((len(samples), len(columns)))
+        for i, sample in enumerate(samples):
+            self.advance(sample)
+            counts[i] = self.x[columns]
+        return samples, counts
+
+    def advance(self, t_end):
+        if t_end > self.t:
+            solution = solve_ivp(self.rhs, (self.t, t_end), self.x, method=self.method, jac=self.jacobian,
+                                 rtol=self.rtol, atol=self.atol)
+            if not solution.success:
+                raise RuntimeError('integration failed at t=%g: %s' % (solution.t[-1], solution.message))
+            self.x = solution.y[:, -1]
+        self.t = t_end
@@ -0,0 +1,67 @@
+#################################
+# Polymerize
+#################################
+
+# Python version of edu.stanford.covert.cell.sim.util.polymerize as the
+# translation process uses it: every row of 'sequences' is the next stretch
+# of monomer (tRNA) indices of one polymerase (ribosome), padded with 'pad'.
+# The rows are extended one column at a time.  In a column, every row still
+# extending asks for one monomer; where a monomer is short, or the energy
+# budget is, the rows allowed to proceed are chosen by one random ranking
+# and the others stop for the rest of the step.  The loop is over the
+# columns only (elongationRate of them); all rows of a column are handled by
+# array operations.
+#
+# The generator is drawn from only in columns that are short of monomers or
+# energy, one uniform per competing row, so a given state and seed always
+# give the same result.
+
+import numpy as np
+
+PAD = -1
+
+
+def polymerize(sequences, substrates, energy, energy_cost, rng, pad=PAD):
+    """Extends the rows of 'sequences' (polymerases x positions) using the
+    monomer counts 'substrates' and 'energy' ('energy_cost' per monomer).
+    Returns (progress per row, substrates left, substrates used, energy
+    left); the inputs are not modified."""
+    sequences = np.asarray(sequences)
+    substrates = np.array(substrates, dtype=np.int64)
+    usage = np.zeros_like(substrates)
+    progress = np.zeros(len(sequences), dtype=np.int64)
+    rows = np.arange(len(sequences))
+    for column in range(sequences.shape[1] if sequences.ndim == 2 else 0):
+        monomers = sequences[rows, column]
+        extending = monomers != pad
+        rows = rows[extending]
+        monomers = monomers[extending].astype(np.intp)
+        if not len(rows):
+            break
+
+        demand = np.bincount(monomers, minlength=len(substrates))
+        budget = max(0, energy) // energy_cost if energy_cost else len(rows)
+        if (demand > substrates).any() or len(rows) > budget:
+            keys = rng.random(len(rows))
+            # rank the rows asking for each monomer; the first
+            # substrates[m] of them get one
+            order = np.lexsort((keys, monomers))
+            sorted_monomers = monomers[order]
+            rank = np.arange(len(order)) - np.searchsorted(sorted_monomers, sorted_monomers)
+            allowed = np.zeros(len(rows), dtype=bool)
+            allowed[order] = rank < substrates[sorted_monomers]
+            # then the first 'budget' of those by the same ranking
+            winners = np.flatnonzero(allowed)
+            if len(winners) > budget:
+                allowed[winners[np.argsort(keys[winners], kind='stable')[budget:]]] = False
+            rows = rows[allowed]
+            monomers = monomers[allowed]
+            demand = np.bincount(monomers, minlength=len(substrates))
+            if not len(rows):
+                break
+
+        progress[rows] += 1
+        substrates -= demand
+        usage += demand
+        energy -= energy_cost * len(rows)
+    return progress, substrates, usage, energy
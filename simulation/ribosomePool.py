@@ -0,0 +1,90 @@
+#################################
+# Ribosome slot pool
+#################################
+
+# Storage of the ribosomes of translation.py as a structure of arrays with
+# a fixed capacity (rib.states, pol.boundMRNAs, pol.nascentMonomerLengths,
+# pol.proteolysisTagLengths).  Translation.m grows these vectors by
+# concatenation and finds idle entries with find(rib.states ==
+# notExistValue) every step.  Here
+#
+#   slots[:n_used]     the slots holding a ribosome, in no particular order
+#   slots[n_used:]     the free list
+#   position[slot]     where a slot is in 'slots'
+#
+# so taking k slots is a slice off the free list, releasing k slots is O(k)
+# swaps, and the ribosomes of a step are slots[:n_used] without a scan.
+# When the free list runs out the capacity is doubled (at least), so the
+# arrays are reallocated O(log n) times over a run.
+
+import numpy as np
+
+# state of a free slot (translation.NOT_EXIST)
+EMPTY = 0
+
+
+class RibosomePool(object):
+    """'capacity' ribosome slots; a free slot has state EMPTY, mRNA -1 and
+    zero lengths."""
+
+    def __init__(self, capacity=0):
+        self.states = np.full(capacity, EMPTY, dtype=np.int8)
+        self.bound_mrnas = np.full(capacity, -1, dtype=np.int64)
+        self.nascent_lengths = np.zeros(capacity, dtype=np.int64)
+        self.tag_lengths = np.zeros(capacity, dtype=np.int64)
+        self.slots = np.arange(capacity, dtype=np.int64)
+        self.position = np.arange(capacity, dtype=np.int64)
+        self.n_used = 0
+
+    @property
+    def capacity(self):
+        return len(self.states)
+
+    def in_use(self):
+        """The slots holding a ribosome (a copy)."""
+        return self.slots[:self.n_used].copy()
+
+    def reserve(self, n):
+        """Makes room for at least 'n' ribosomes."""
+        if n <= self.capacity:
+            return
+        old = self.capacity
+        extra = max(n, 2 * old) - old
+        self.states = np.concatenate([self.states, np.full(extra, EMPTY, dtype=np.int8)])
+        self.bound_mrnas = np.concatenate([self.bound_mrnas, np.full(extra, -1, dtype=np.int64)])
+        self.nascent_lengths = np.concatenate([self.nascent_lengths, np.zeros(extra, dtype=np.int64)])
+        self.tag_lengths = np.concatenate([self.tag_lengths, np.zeros(extra, dtype=np.int64)])
+        new = np.arange(old, old + extra, dtype=np.int64)
+        self.slots = np.concatenate([self.slots, new])
+        self.position = np.concatenate([self.position, new])
+
+    def acquire(self, k):
+        """Takes 'k' free slots off the free list and returns them; the
+        caller sets their state."""
+        self.reserve(self.n_used + k)
+        slots = self.slots[self.n_used:self.n_used + k].copy()
+        self.n_used += k
+        return slots
+
+    def release(self, slots):
+        """Empties the (distinct, used) 'slots' and puts them back on the
+        free list."""
+        k = len(slots)
+        if not k:
+            return
+        self.states[slots] = EMPTY
+        self.bound_mrnas[slots] = -1
+        self.nascent_lengths[slots] = 0
+        self.tag_lengths[slots] = 0
+        # released slots in the part that stays used swap places with the
+        # used slots in the last k places
+        end = self.n_used - k
+        where = self.position[slots]
+        holes = where[where < end]
+        tail = self.slots[end:self.n_used]
+        fillers = tail[self.states[tail] != EMPTY]
+        self.slots[holes] = fillers
+        self.position[fillers] = holes
+        self.slots[end:self.n_used] = slots
+        self.position[slots] = np.arange(end, self.n_used)
+        self.n_used = end
@@ -0,0 +1,165 @@
+#################################
+# Tau-leaping
+#################################
+
+# Approximate stochastic simulation of a Network (network.py) by explicit
+# tau-leaping with the step size selection of Cao, Gillespie and Petzold
+# (J. Chem. Phys. 124:044109, 2006).  A leap of length tau fires every
+# non-critical reaction a Poisson(a_j * tau) number of times; tau is the
+# largest step over which the expected change and the standard deviation
+# of every reactant count stay below max(epsilon * x_i / g_i, 1), so that
+# no propensity changes by more than about epsilon.
+#
+# Reactions that could exhaust a reactant in fewer than n_critical firings
+# are critical: at most one of them fires per leap, chosen as in the
+# direct method.  When tau is only a few times the mean time between
+# events, exact direct-method steps are cheaper and are used instead.
+#
+# Every operation is over all reactions at once (propensities, sparse
+# stoichiometry products), so the cost of a leap is O(R) however many
+# events it contains; this is what makes the high propensities of the
+# GTP, H2O and ATP reactions affordable.
+
+import numpy as np
+
+# default accuracy (Cao et al. use 0.03) and critical reaction threshold
+EPSILON = 0.03
+N_CRITICAL = 10
+
+# exact steps are used while tau < SSA_FACTOR / a0, SSA_STEPS at a time
+SSA_FACTOR = 10.0
+SSA_STEPS = 100
+
+
+class TauLeapingSimulator(object):
+    """Runs tau-leaping on 'network' from its initial counts (or 'x0');
+    'seed' seeds the numpy Generator that supplies all random numbers.
+    The interface is that of nextReaction.NextReactionSimulator."""
+
+    def __init__(self, network, seed=None, x0=None, epsilon=EPSILON, n_critical=N_CRITICAL):
+        self.network = network
+        self.epsilon = epsilon
+        self.n_critical = n_critical
+
+        s = network.stoichiometry.tocsc()
+        self.stoichiometry = s
+        self.square = s.multiply(s).tocsr()
+        # reactants (negative entries) by reaction, for the critical test
+        consumed = (-s).maximum(0).tocsc()
+        consumed.eliminate_zeros()
+        self.consumed = consumed
+        self._has_reactants = np.diff(consumed.indptr) > 0
+
+        # g_i: the highest order of any propensity in which species i is a
+        # factor.  The propensities are literal products, so a relative
+        # change e in x_i changes them by at most g_i * e.
+        order = np.diff(network.factor_ptr)
+        self.g = np.zeros(network.n_species)
+        np.maximum.at(self.g, network.factor_species, np.repeat(order, order).astype(np.float64))
+        self.reactant_species = np.flatnonzero((self.g > 0) & (np.diff(s.tocsr().indptr) > 0))
+        self.reset(seed, x0)
+
+    def reset(self, seed=None, x0=None):
+        """Starts again at time 0 from the initial counts (or 'x0') with a
+        new 'seed', like NextReactionSimulator.reset."""
+        self.rng = np.random.default_rng(seed)
+        self.t = 0.0
+        self.events = 0
+        self.leaps = 0
+        self.x = np.array(self.network.x0 if x0 is None else x0, dtype=np.int64)
+
+    def run(self, t_end, dt=None, observe=None):
+        """Simulates until time 't_end' and returns (times, counts) like
+        NextReactionSimulator.run."""
+        if observe is None:
+            columns = np.arange(self.network.n_species)
+        else:
+            columns = np.array([self.network.index(name) for name in observe], dtype=np.int64)
+        if dt is None:
+            samples = [t_end]
+        else:
+            samples = list(np.arange(self.t, t_end, dt)) + [t_end]
+        times = []
+        counts = []
+        for sample in samples:
+            self.advance(sample)
+            times.append(sample)
+            counts.append(self.x[columns].copy())
+        return np.array(times), np.array(counts, dtype=np.int64).reshape(len(times), len(columns))
+
+    def advance(self, t_end):
+        """Leaps (or steps) until 't_end'; the state is then the state at
+        't_end'."""
+        network = self.network
+        while self.t < t_end:
+            a = network.propensities(self.x)
+            a0 = a.sum()
+            if a0 <= 0.0:
+                break
+            critical = self._critical(a)
+            tau1 = self._tau(a, critical)
+            if tau1 < SSA_FACTOR / a0:
+                self._direct(a, t_end)
+                continue
+
+            a0_critical = a[critical].sum()
+            while True:
+                tau2 = self.rng.standard_exponential() / a0_critical if a0_critical > 0 else np.inf
+                tau = min(tau1, tau2, t_end - self.t)
+                firings = np.zeros(network.n_reactions, dtype=np.int64)
+                firings[~critical] = self.rng.poisson(a[~critical] * tau)
+                if tau == tau2:
+                    firings[self._choose(np.where(critical, a, 0.0), a0_critical)] += 1
+                x = self.x + self.stoichiometry @ firings
+                if (x >= 0).all():
+                    break
+                tau1 /= 2.0
+            self.x = x
+            self.t += tau
+            self.events += int(firings.sum())
+            self.leaps += 1
+        self.t = max(self.t, t_end)
+
+    def _critical(self, a):
+        """Reactions with a_j > 0 that could exhaust a reactant in fewer
+        than n_critical firings."""
+        s = self.consumed
+        firings = np.full(len(a), np.inf)
+        if len(s.data):
+            ratios = np.floor(self.x[s.indices] / s.data)
+            filled = self._has_reactants
+            firings[filled] = np.minimum.reduceat(ratios, s.indptr[:-1][filled])
+        return (a > 0.0) & (firings < self.n_critical)
+
+    def _tau(self, a, critical):
+        """Cao's tau over the non-critical reactions."""
+        noncritical = np.where(critical, 0.0, a)
+        if not noncritical.any():
+            return np.inf
+        species = self.reactant_species
+        mu = (self.stoichiometry @ noncritical)[species]
+        sigma2 = (self.square @ noncritical)[species]
+        bound = np.maximum(self.epsilon * self.x[species] / self.g[species], 1.0)
+        with np.errstate(divide='ignore'):
+            return min((bound / np.abs(mu)).min(initial=np.inf), (bound ** 2 / sigma2).min(initial=np.inf))
+
+    def _direct(self, a, t_end):
+        # up to SSA_STEPS exact steps of the direct method
+        s = self.stoichiometry
+        for step in range(SSA_STEPS):
+            a0 = a.sum()
+            if a0 <= 0.0:
+                return
+            tau = self.rng.standard_exponential() / a0
+            if self.t + tau > t_end:
+                self.t = t_end
+                return
+            j = self._choose(a, a0)
+            self.x[s.indices[s.indptr[j]:s.indptr[j + 1]]] += s.data[s.indptr[j]:s.indptr[j + 1]]
+            self.t += tau
+            self.events += 1
+            a = self.network.propensities(self.x)
+
+    def _choose(self, a, a0):
+        cumulative = np.cumsum(a)
+        return min(int(np.searchsorted(cumulative, self.rng.random() * a0, side='right')), len(a) - 1)
@@ -0,0 +1,424 @@
+#################################
+# Translation process
+#################################
+
+# Python version of TranslationAlgorithm/Translation.m.  Ribosomes are not
+# species: as in the MATLAB process every ribosome is an entry of a few
+# vectors
+#
+#   states                  NOT_EXIST, ACTIVE or STALLED    (rib.states)
+#   bound_mrnas             protein/mRNA index, -1 if none  (pol.boundMRNAs)
+#   nascent_lengths         residues polymerised so far     (pol.nascentMonomerLengths)
+#   tag_lengths             proteolysis tag residues        (pol.proteolysisTagLengths)
+#
+# kept in a RibosomePool (ribosomePool.py), and the counts of mRNAs,
+# monomers, tRNAs, enzymes and substrates are vectors indexed like the
+# MATLAB properties, so the state is O(ribosomes + proteins) and
+# evolve_state is a handful of numpy operations per step.  Indices are 0-based and -1 replaces MATLAB's 0 for "none".
+
+import numpy as np
+
+from fenwick import FenwickTree
+from network import _generator
+from polymerize import PAD, polymerize
+from ribosomePool import EMPTY, RibosomePool
+
+# the shared tRNA index sequences (modelGeneration/tRNASequences.py)
+tRNASequences = _generator('tRNASequences')
+
+# ribosome states (rib.notExistValue, rib.activeValue, rib.stalledValue)
+NOT_EXIST = EMPTY
+ACTIVE = 1
+STALLED = 2
+
+SUBSTRATES = ['ALA', 'ARG', 'ASN', 'ASP', 'CYS', 'GLN', 'GLU', 'GLY', 'HIS', 'ILE',
+              'LEU', 'LYS', 'MET', 'PHE', 'PRO', 'SER', 'THR', 'TRP', 'TYR', 'VAL', 'FMET',
+              'GTP', 'GDP', 'PI', 'H2O', 'H']
+GTP, GDP, PI, H2O, H = [SUBSTRATES.index(s) for s in ['GTP', 'GDP', 'PI', 'H2O', 'H']]
+
+ENZYMES = ['MG_173_MONOMER',    # translation initiation factor IF-1
+           'MG_142_MONOMER',    # translation initiation factor IF-2
+           'MG_196_MONOMER',    # translation initiation factor IF-3
+           'MG_089_DIMER',      # translation elongation factor G
+           'MG_026_MONOMER',    # translation elongation factor P
+           'MG_451_DIMER',      # translation elongation factor Tu
+           'MG_433_DIMER',      # translation elongation factor Ts
+           'MG_258_MONOMER',    # peptide chain release factor 1
+           'MG_435_MONOMER',    # ribosome recycling factor
+           'RIBOSOME_30S',
+           'RIBOSOME_30S_IF3',
+           'RIBOSOME_50S',
+           'RIBOSOME_70S',
+           'MG_0004',           # tmRNA
+           'MG_059_MONOMER',    # SsrA-binding protein
+           'MG_083_MONOMER']    # peptidyl-tRNA hydrolase
+(IF1, IF2, IF3, EFG, EFP, EFTU, EFTS, RF1, RRF, RIBOSOME_30S, RIBOSOME_30S_IF3, RIBOSOME_50S,
+ RIBOSOME_70S, TMRNA, TMRNA_BINDING_PROTEIN, PEPTIDYL_TRNA_HYDROLASE) = range(len(ENZYMES))
+TRANSLATION_FACTORS = slice(IF1, RRF + 1)
+ELONGATION_FACTORS = [EFG, EFP, EFTU, EFTS]
+
+# ribosomeElongationRate, amino acids per second per ribosome
+ELONGATION_RATE = 16
+
+# average masses of the amino acid residues in a chain and of the water a
+# whole chain adds, Da
+RESIDUE_WEIGHTS = {'A': 71.0788, 'R': 156.1875, 'N': 114.1038, 'D': 115.0886, 'C': 103.1388,
+                   'E': 129.1155, 'Q': 128.1307, 'G': 57.0519, 'H': 137.1411, 'I': 113.1594,
+                   'L': 113.1594, 'K': 128.1741, 'M': 131.1926, 'F': 147.1766, 'P': 97.1167,
+                   'S': 87.0782, 'T': 101.1051, 'W': 186.2132, 'Y': 163.1760, 'V': 99.1326}
+WATER_WEIGHT = 18.0153
+
+# The knowledge base here has no tmRNA sequence; this is the SsrA tag of
+# E. coli.  The first residue (alanine) is carried by the tRNA-like domain
+# of the tmRNA itself.
+PROTEOLYSIS_TAG = 'AANDENYALAA'
+
+
+def remove_mass(counts, weights, mass, rng):
+    """Removes molecules from 'counts' (in place) one at a time, each drawn
+    in proportion to the counts left, until at least 'mass' of 'weights'
+    has been removed; returns the removed counts.
+
+    The molecules removed are the first ones of a random order of all
+    molecules.  They are drawn in batches: a multivariate hypergeometric
+    draw of about as many molecules as the remaining mass needs on
+    average, put in random order and cut where the mass is reached."""
+    weights = np.asarray(weights, dtype=np.float64)
+    removed = np.zeros(len(counts), dtype=np.int64)
+    while mass > 0 and counts.any():
+        total = int(counts.sum())
+        n = int(min(total, max(1, mass // (weights @ counts / total))))
+        batch = rng.multivariate_hypergeometric(counts, n)
+        molecules = rng.permutation(np.repeat(np.arange(len(counts)), batch))
+        cumulative = np.cumsum(weights[molecules])
+        stop = min(n, int(np.searchsorted(cumulative, mass)) + 1)
+        taken = np.bincount(molecules[:stop], minlength=len(counts))
+        counts -= taken
+        removed += taken
+        mass -= cumulative[stop - 1]
+    return removed
+
+
+class Translation(object):
+    """State and evolve_state of the translation process for the proteins
+    of a ProteinSequences ('proteins') and a SingleAA tRNA mapping.
+
+    The counts (mrnas and monomers per protein, free_trnas and
+    aminoacylated_trnas per tRNA in self.tRNAs, enzymes and bound_enzymes
+    per ENZYMES, substrates per SUBSTRATES and the tmRNA scalars) are
+    public numpy arrays to be set by the caller before initialize_state.
+    'seed' seeds the numpy Generator used for every random draw (the
+    MATLAB randStream).  The tRNA sequences are those of
+    tRNASequences.load_trna_sequences with the synonymous tRNA rule
+    'synonyms', read from or written to 'trna_cache'."""
+
+    def __init__(self, proteins, SingleAA, elongation_rate=ELONGATION_RATE,
+                 tmrna_binding_probability=0.0, proteolysis_tag=PROTEOLYSIS_TAG, seed=None,
+                 synonyms=tRNASequences.ROTATE, trna_cache=tRNASequences.DEFAULT_CACHE):
+        self.names = list(proteins.names)
+        trnas = tRNASequences.load_trna_sequences(proteins, SingleAA, synonyms, trna_cache)
+        self.tRNAs = trnas.tRNAs
+        self.sequences, self.offsets = trnas.indices, trnas.offsets
+        self.monomer_lengths = np.diff(self.offsets)
+        # weight of the first n residues of protein i: prefix_weights[offsets[i] + n] - ..[offsets[i]]
+        table = np.zeros(256)
+        for AA in RESIDUE_WEIGHTS:
+            table[ord(AA)] = RESIDUE_WEIGHTS[AA]
+        self.prefix_weights = np.zeros(len(self.sequences) + 1)
+        np.cumsum(table[np.asarray(proteins.residues, dtype=np.uint8)], out=self.prefix_weights[1:])
+        self.tag_sequence = np.array([self.tRNA_index(tRNASequences.tRNA_names(SingleAA[AA])[0])
+                                      for AA in proteolysis_tag], dtype=np.int16)
+        self.tag_length = len(self.tag_sequence)
+        self.proteolysis_tag = proteolysis_tag
+        self.elongation_rate = elongation_rate
+        self.tmrna_binding_probability = tmrna_binding_probability
+        self.rng = np.random.default_rng(seed)
+
+        n = len(self.names)
+        self.mrnas = np.zeros(n, dtype=np.int64)
+        self.monomers = np.zeros(n, dtype=np.int64)
+        self.free_trnas = np.zeros(len(self.tRNAs), dtype=np.int64)
+        self.aminoacylated_trnas = np.zeros(len(self.tRNAs), dtype=np.int64)
+        self.enzymes = np.zeros(len(ENZYMES), dtype=np.int64)
+        self.bound_enzymes = np.zeros(len(ENZYMES), dtype=np.int64)
+        self.substrates = np.zeros(len(SUBSTRATES), dtype=np.int64)
+        self.free_tmrna = 0
+        self.aminoacylated_tmrna = 0
+        self.bound_tmrna = 0
+        # (protein, nascent length, tag length) of every polypeptide
+        # released by a stalled ribosome
+        self.aborted_polypeptides = []
+
+        self.ribosomes = RibosomePool()
+
+    # the ribosome vectors, views of the pool's arrays
+    states = property(lambda self: self.ribosomes.states)
+    bound_mrnas = property(lambda self: self.ribosomes.bound_mrnas)
+    nascent_lengths = property(lambda self: self.ribosomes.nascent_lengths)
+    tag_lengths = property(lambda self: self.ribosomes.tag_lengths)
+
+    def tRNA_index(self, name):
+        return self.tRNAs.index(name)
+
+    #########################################################################
+    # Checkpoints (checkpoint.py)
+    #########################################################################
+
+    CHECKPOINT_STATIC = ['names', 'tRNAs', 'sequences', 'offsets', 'tag_sequence', 'elongation_rate',
+                         'tmrna_binding_probability']
+
+    def checkpoint_state(self):
+        return {'mrnas': self.mrnas, 'monomers': self.monomers, 'free_trnas': self.free_trnas,
+                'aminoacylated_trnas': self.aminoacylated_trnas, 'enzymes': self.enzymes,
+                'bound_enzymes': self.bound_enzymes, 'substrates': self.substrates,
+                'free_tmrna': int(self.free_tmrna), 'aminoacylated_tmrna': int(self.aminoacylated_tmrna),
+                'bound_tmrna': int(self.bound_tmrna),
+                'aborted_polypeptides': np.array(self.aborted_polypeptides, dtype=np.int64).reshape(-1, 3),
+                'states': self.states, 'bound_mrnas': self.bound_mrnas,
+                'nascent_lengths': self.nascent_lengths, 'tag_lengths': self.tag_lengths,
+                'slots': self.ribosomes.slots, 'n_used': int(self.ribosomes.n_used)}
+
+    def restore_state(self, state):
+        for name in ['mrnas', 'monomers', 'free_trnas', 'aminoacylated_trnas', 'enzymes', 'bound_enzymes',
+                     'substrates', 'free_tmrna', 'aminoacylated_tmrna', 'bound_tmrna']:
+            setattr(self, name, state[name])
+        pool = RibosomePool()
+        for name in ['states', 'bound_mrnas', 'nascent_lengths', 'tag_lengths', 'slots', 'n_used']:
+            setattr(pool, name, state[name])
+        pool.position = np.empty_like(pool.slots)
+        pool.position[pool.slots] = np.arange(len(pool.slots))
+        self.ribosomes = pool
+        self.aborted_polypeptides = [tuple(row) for row in state['aborted_polypeptides'].tolist()]
+
+    #########################################################################
+    # initializeState: ribosomes at steady state on the mRNAs
+    #########################################################################
+
+    def initialize_state(self, mature=None, mature_weights=None):
+        """Binds as many 70S ribosomes as subunits, elongation factors and
+        mRNAs allow, to mRNAs drawn by expression times length, spread
+        evenly along each mRNA.
+
+        'mature' are the counts of the mature monomers and complexes of
+        the cell and 'mature_weights' their weights in Da.  If they are
+        given, molecules are removed from 'mature' at random until the
+        weight of the nascent polypeptides is made up for (the
+        decrement of matureProteinWt in Translation.m); the removed counts
+        are returned."""
+        e = self.enzymes
+        e += self.bound_enzymes
+        self.bound_enzymes[:] = 0
+        e[RIBOSOME_30S] += e[RIBOSOME_70S]
+        e[RIBOSOME_50S] += e[RIBOSOME_70S]
+        e[RIBOSOME_70S] = 0
+        e[RIBOSOME_30S] += e[RIBOSOME_30S_IF3]
+        e[IF3] += e[RIBOSOME_30S_IF3]
+        e[RIBOSOME_30S_IF3] = 0
+
+        bound = int(min(e[RIBOSOME_30S], e[RIBOSOME_50S], e[ELONGATION_FACTORS].min(), self.mrnas.sum()))
+        e[RIBOSOME_30S] -= bound
+        e[RIBOSOME_50S] -= bound
+        e[ELONGATION_FACTORS] -= bound
+        self.bound_enzymes[ELONGATION_FACTORS] += bound
+        self.bound_enzymes[RIBOSOME_70S] = bound
+
+        self.ribosomes = RibosomePool(2 * bound)
+        slots = self.ribosomes.acquire(bound)
+        weights = (self.mrnas * self.monomer_lengths).astype(np.float64)
+        if bound > 0:
+            self.bound_mrnas[slots] = self.rng.choice(len(weights), bound, p=weights / weights.sum())
+        self.states[slots] = ACTIVE
+
+        # partition each mRNA among its ribosomes, random position within
+        # the partition
+        rate = self.elongation_rate
+        for i in np.unique(self.bound_mrnas[slots]):
+            ribosomes = slots[self.bound_mrnas[slots] == i]
+            length = self.monomer_lengths[i]
+            partitions = np.round(np.arange(len(ribosomes) + 1) * (length + rate - 1) / len(ribosomes) -
+                                  0.5 * rate)
+            for j in range(len(ribosomes)):
+                low = partitions[j] + 0.5 * rate
+                high = partitions[j + 1] - 0.5 * rate
+                if high < low:
+                    position = max(1, min(length, partitions[j:j + 2].mean()))
+                else:
+                    position = low + self.rng.random() * (high - low)
+                self.nascent_lengths[ribosomes[j]] = int(np.round(position))
+
+        if mature is not None:
+            return remove_mass(mature, mature_weights, self.nascent_weight(), self.rng)
+
+    def nascent_weight(self):
+        """Weight in Da of the polypeptides on the ribosomes (pol.dryWeight),
+        proteolysis tags included."""
+        bound = self.ribosomes.in_use()
+        start = self.offsets[self.bound_mrnas[bound]]
+        chains = self.prefix_weights[start + self.nascent_lengths[bound]] - self.prefix_weights[start]
+        tags = np.cumsum([0.0] + [RESIDUE_WEIGHTS[AA] for AA in self.proteolysis_tag])
+        return chains.sum() + tags[self.tag_lengths[bound]].sum() + WATER_WEIGHT * len(bound)
+
+    #########################################################################
+    # evolveState: one step of simulationTime = 1 s
+    #########################################################################
+
+    def evolve_state(self):
+        rng = self.rng
+        free = self.enzymes[TRANSLATION_FACTORS].copy()
+        bound_factors = self.bound_enzymes[TRANSLATION_FACTORS].copy()
+        ribosome30S = int(self.enzymes[RIBOSOME_30S])
+        ribosome30SIF3 = int(self.enzymes[RIBOSOME_30S_IF3])
+        ribosome50S = int(self.enzymes[RIBOSOME_50S])
+        bound70S = int(self.bound_enzymes[RIBOSOME_70S])
+
+        # form 30S-IF3
+        new = min(ribosome30S, free[IF3])
+        ribosome30SIF3 += new
+        ribosome30S -= new
+        free[IF3] -= new
+
+        pool = self.ribosomes
+        lengths = self.monomer_lengths
+        # every used slot holds an ACTIVE or STALLED ribosome
+        active = pool.in_use()
+
+        binding = self.mrnas.copy()
+        binding[lengths == 0] = 0
+        tRNAs = self.free_trnas + self.aminoacylated_trnas
+        energy_allocation = max(0, int(self.substrates[GTP]))
+        energy = energy_allocation
+        water_allocation = max(0, int(self.substrates[H2O]))
+        water = water_allocation
+
+        # recycle elongation factors
+        free[ELONGATION_FACTORS] += bound_factors[ELONGATION_FACTORS]
+        bound_factors[ELONGATION_FACTORS] = 0
+
+        # select bound mRNAs to elongate: in a random order, finishing
+        # ribosomes always, the others while a full set of elongation
+        # factors is left
+        n = min(len(active), bound70S, min(energy, water) // 2)
+        chosen = active[rng.permutation(len(active))[:n]]
+        finished = ((pool.states[chosen] == ACTIVE) &
+                    (lengths[pool.bound_mrnas[chosen]] == pool.nascent_lengths[chosen])) | \
+            (pool.tag_lengths[chosen] == self.tag_length)
+        waiting = chosen[~finished]
+        factors = int(min(len(waiting), free[ELONGATION_FACTORS].min()))
+        free[ELONGATION_FACTORS] -= factors
+        bound_factors[ELONGATION_FACTORS] += factors
+        ribosomes = np.sort(np.concatenate([chosen[finished], waiting[:factors]]))
+        n_elongating = len(ribosomes)
+
+        # initiate on free ribosome slots, one mRNA copy per ribosome
+        n_initiating = int(min(ribosome30SIF3, ribosome50S, free[IF1], free[IF2],
+                               max(0, min(energy, water) - 2 * n_elongating), binding.sum()))
+        if n_initiating > 0:
+            ribosome30SIF3 -= n_initiating
+            ribosome50S -= n_initiating
+            bound70S += n_initiating
+            free[IF3] += n_initiating
+            energy -= n_initiating
+            water -= n_initiating
+            # randsample(numel(bndProbs), 1, true, bndProbs) for every
+            # ribosome, bndProbs decremented after each draw, as one batch
+            slots = pool.acquire(n_initiating)
+            pool.bound_mrnas[slots] = FenwickTree(binding).take(n_initiating, rng)
+            pool.states[slots] = ACTIVE
+
+        # translate the next elongation_rate residues of every elongating
+        # ribosome
+        sequences = self._elongation_sequences(ribosomes)
+        starting = (pool.nascent_lengths[ribosomes] + pool.tag_lengths[ribosomes]) == 0
+        energy_water = int(min(energy, water - starting.sum()))
+        progress, self.aminoacylated_trnas, usage, energy_water_left = polymerize(
+            sequences, self.aminoacylated_trnas, energy_water, 2, rng)
+        if progress.any():
+            water -= (energy_water - energy_water_left) + int((starting & (progress > 0)).sum())
+            energy -= energy_water - energy_water_left
+            stalled = pool.states[ribosomes] == STALLED
+            pool.nascent_lengths[ribosomes] += progress * ~stalled
+            pool.tag_lengths[ribosomes] += progress * stalled
+
+        # terminate, keep elongating or stall (tmRNA): the ribosomes that
+        # moved this step or reached the end are released, in one random
+        # order, while energy and water last; RF1, RRF, IF-3 and EF-G (which
+        # a ribosome that moved already holds) are required but not used up
+        # (ribosomes is sorted, so the elongating ones are found by search)
+        used = pool.in_use()
+        where = np.minimum(np.searchsorted(ribosomes, used), max(0, n_elongating - 1))
+        elongating = (ribosomes[where] == used) if n_elongating else np.zeros(len(used), dtype=bool)
+        candidates = elongating | ((pool.states[used] == ACTIVE) & (pool.nascent_lengths[used] > 0))
+        shuffle = rng.permutation(int(candidates.sum()))
+        order = used[candidates][shuffle]
+        elongating = elongating[candidates][shuffle]
+        step_progress = np.zeros(len(order), dtype=np.int64)
+        step_progress[elongating] = progress[where[candidates][shuffle][elongating]]
+        bound = pool.bound_mrnas[order]
+        nascent = pool.nascent_lengths[order]
+        moved = step_progress > 0
+        done = elongating & (nascent >= lengths[bound])
+        finishing = elongating & (moved | done)
+        releasing = finishing & (done | (pool.tag_lengths[order] >= self.tag_length)) & (moved | (free[EFG] > 0))
+        if not (free[RF1] and free[RRF] and free[IF3]):
+            releasing[:] = False
+        releasing &= np.cumsum(releasing) <= max(0, min(energy, water)) // 2
+        # stalling candidates are drawn in the same order, one uniform each
+        stalling = ~finishing & (pool.states[order] == ACTIVE) & (nascent > 0)
+        if self.aminoacylated_tmrna > 0 and self.enzymes[TMRNA_BINDING_PROTEIN] > 0 and \
+                self.enzymes[PEPTIDYL_TRNA_HYDROLASE] > 0 and stalling.any():
+            stalling[stalling] = rng.random(int(stalling.sum())) < self.tmrna_binding_probability
+            stalling &= np.cumsum(stalling) <= self.aminoacylated_tmrna
+        else:
+            stalling[:] = False
+
+        released = order[releasing]
+        completed = pool.states[released] == ACTIVE
+        self.monomers += np.bincount(bound[releasing][completed], minlength=len(self.monomers))
+        aborted = int((~completed).sum())
+        if aborted:
+            self.aborted_polypeptides += [(m, n, self.tag_length) for m, n in
+                                          zip(bound[releasing][~completed].tolist(),
+                                              nascent[releasing][~completed].tolist())]
+            self.bound_tmrna -= aborted
+            self.free_tmrna += aborted
+        pool.release(released)
+        energy -= 2 * len(released)
+        water -= 2 * len(released)
+        bound70S -= len(released)
+        ribosome30S += len(released)
+        ribosome50S += len(released)
+
+        stalled = order[stalling]
+        pool.states[stalled] = STALLED
+        pool.tag_lengths[stalled] = 1
+        self.bound_tmrna += len(stalled)
+        self.aminoacylated_tmrna -= len(stalled)
+
+        # store enzymes and account for used substrates
+        self.enzymes[TRANSLATION_FACTORS] = free
+        self.bound_enzymes[TRANSLATION_FACTORS] = bound_factors
+        self.enzymes[RIBOSOME_30S] = ribosome30S
+        self.enzymes[RIBOSOME_30S_IF3] = ribosome30SIF3
+        self.enzymes[RIBOSOME_50S] = ribosome50S
+        self.bound_enzymes[RIBOSOME_70S] = bound70S
+        self.free_trnas = tRNAs - self.aminoacylated_trnas
+        used = energy_allocation - energy
+        self.substrates[GTP] -= used
+        self.substrates[H2O] -= water_allocation - water
+        self.substrates[GDP] += used
+        self.substrates[PI] += used
+        self.substrates[H] += used + int(usage.sum())
+
+    def _elongation_sequences(self, ribosomes):
+        """elngSeqs: the next elongation_rate tRNA indices of each ribosome,
+        from its mRNA or, if stalled, the proteolysis tag; -1 past the end."""
+        rate = np.arange(self.elongation_rate)
+        stalled = self.states[ribosomes] == STALLED
+        position = np.where(stalled, self.tag_lengths[ribosomes], self.nascent_lengths[ribosomes])[:, None] + rate
+        mrna = self.bound_mrnas[ribosomes]
+        sequences = np.full(position.shape, PAD, dtype=np.int16)
+        inside = ~stalled[:, None] & (position < self.monomer_lengths[mrna][:, None])
+        sequences[inside] = self.sequences[(self.offsets[mrna][:, None] + position)[inside]]
+        tag = stalled[:, None] & (position < self.tag_length)
+        sequences[tag] = self.tag_sequence[position[tag]]
+        return sequences
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('libsbml')
+
+import aminoacylation
+import checkpoint
+import network
+import translation
+from proteinSequences import from_rows, load_sequences
+
+
+def subset(chosen):
+    proteins = load_sequences()
+    return from_rows([(proteins.names[n], proteins.lengths[n], proteins.sequence(n)) for n in chosen])
+
+
+def translation_engine(seed, chosen=(0, 1, 2)):
+    generator = network._generator('TranslationSBMLgenerator')
+    engine = translation.Translation(subset(chosen), generator.SingleAA, seed=seed,
+                                     tmrna_binding_probability=0.01, trna_cache=None)
+    engine.mrnas[:] = 2
+    engine.aminoacylated_trnas[:] = 50
+    engine.enzymes[:] = 20
+    engine.substrates[:] = 10 ** 6
+    engine.aminoacylated_tmrna = 5
+    engine.initialize_state()
+    return engine
+
+
+def evolve(engine, steps):
+    for step in range(steps):
+        if isinstance(engine, translation.Translation):
+            engine.aminoacylated_trnas += engine.free_trnas
+            engine.free_trnas[:] = 0
+        engine.evolve_state()
+
+
+def assert_same_state(a, b):
+    for name, value in a.checkpoint_state().items():
+        assert np.array_equal(np.asarray(value), np.asarray(b.checkpoint_state()[name])), name
+
+
+def test_translation_continues_bit_for_bit(tmp_path):
+    path = str(tmp_path / 'translation.ckpt')
+    engine = translation_engine(1)
+    evolve(engine, 10)
+    checkpoint.save(engine, path)
+    evolve(engine, 10)
+    restored = checkpoint.load(translation_engine(2), path)
+    evolve(restored, 10)
+    assert_same_state(engine, restored)
+    assert engine.aborted_polypeptides == restored.aborted_polypeptides
+    assert engine.monomers.sum() > 0
+
+
+def test_aminoacylation_continues_bit_for_bit(tmp_path):
+    path = str(tmp_path / 'aminoacylation.ckpt')
+    model = network.aminoacylation_model()
+    engine = aminoacylation.Aminoacylation(model, seed=3)
+    engine.initialize_state()
+    engine.free_rnas += 500
+    engine.substrates += 10 ** 5
+    evolve(engine, 3)
+    checkpoint.save(engine, path)
+    evolve(engine, 3)
+    restored = checkpoint.load(aminoacylation.Aminoacylation(model), path)
+    evolve(restored, 3)
+    assert_same_state(engine, restored)
+
+
+def test_load_rejects_other_proteins(tmp_path):
+    path = str(tmp_path / 'translation.ckpt')
+    checkpoint.save(translation_engine(1), path)
+    with pytest.raises(ValueError):
+        checkpoint.load(translation_engine(1, (0, 1, 3)), path)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('libsbml')
+
+import delaySSA
+import network
+
+
+def reduced_network(n_proteins=3):
+    generator = network._generator('TranslationSBMLgenerator')
+    net = network.translation_network(list(generator.prot_names[:n_proteins]), generator.prot_len[:n_proteins],
+                                      generator.sequence[:n_proteins], buffered=network.METABOLITES,
+                                      reduced=True)
+    x0 = net.x0.copy()
+    for i, name in enumerate(net.species):
+        if name.startswith('aminoacylated_'):
+            x0[i] = 200
+        elif name in ('RIBOSOME_30S_IF3', 'RIBOSOME_50S', 'MG_258_MONOMER'):
+            x0[i] = 10
+    return net, x0
+
+
+def test_reduced_model_counts_stay_non_negative():
+    net, x0 = reduced_network()
+    for seed in range(3):
+        simulator = delaySSA.DelaySimulator(net, seed=seed, x0=x0)
+        times, counts = simulator.run(20, dt=0.5)
+        assert counts.min() >= 0
+        assert simulator.completions > 0
+
+
+def test_bulk_initiation_waits_for_its_tRNAs():
+    net, x0 = reduced_network()
+    x0[[i for i, name in enumerate(net.species) if name.startswith('aminoacylated_')]] = 1
+    elongating = [name for name in net.species if name.endswith('_elongating')]
+    simulator = delaySSA.DelaySimulator(net, seed=0, x0=x0)
+    times, counts = simulator.run(20)
+    assert counts.min() >= 0
+    assert [simulator.x[net.index(name)] for name in elongating] == [0] * len(elongating)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+import ensemble
+from network import Network
+
+
+def birth_death_network():
+    # 0 -> A at rate 20, A -> 0 at rate 1 per copy
+    stoichiometry = sp.csc_matrix(np.array([[1, -1]]))
+    return Network(['A'], [0], ['birth', 'death'], stoichiometry, [20.0, 1.0], [0, 0, 1], [0])
+
+
+@pytest.mark.parametrize('method', sorted(ensemble.SIMULATORS))
+def test_reset_repeats_a_new_simulator(method):
+    network = birth_death_network()
+    fresh = ensemble.SIMULATORS[method](network, seed=7).run(5.0, dt=1.0)[1]
+    simulator = ensemble.SIMULATORS[method](network, seed=1)
+    simulator.run(3.0)
+    simulator.reset(7)
+    assert np.array_equal(simulator.run(5.0, dt=1.0)[1], fresh)
+
+
+def test_statistics_do_not_depend_on_processes():
+    network = birth_death_network()
+    one = ensemble.run_ensemble(network, 20, 4.0, dt=1.0, observe=['A'], seed=3, processes=1,
+                                batch=3, histograms=True)
+    two = ensemble.run_ensemble(network, 20, 4.0, dt=1.0, observe=['A'], seed=3, processes=2, batch=5)
+    counts = np.array([ensemble.SIMULATORS['nextReaction'](network, seed=child).run(4.0, dt=1.0)[1]
+                       for child in np.random.SeedSequence(3).spawn(20)], dtype=np.float64)
+    for statistics in (one, two):
+        assert statistics.n == 20
+        assert np.allclose(statistics.mean(), counts.mean(axis=0))
+        assert np.allclose(statistics.variance(), counts.var(axis=0, ddof=1))
+    assert np.array_equal(one.quantile(0.5), np.array([[sorted(c)[9]] for c in counts[:, :, 0].T]))
+    with pytest.raises(ValueError):
+        two.quantile(0.5)
+    with pytest.raises(ValueError):
+        ensemble.run_ensemble(network, 2, 1.0)
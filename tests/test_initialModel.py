@@ -0,0 +1,19 @@
+import pytest
+
+libsbml = pytest.importorskip('libsbml')
+
+import InitialModel
+
+
+def test_create_model_on_a_protein_subset(tmp_path, monkeypatch):
+    # a subset other than the first proteins, with synonymous tRNAs, as
+    # benchmarkGeneration.py runs it
+    monkeypatch.chdir(tmp_path)
+    chosen = [7, 3, 12]
+    names = [InitialModel.prot_names[n] for n in chosen]
+    lengths = [InitialModel.prot_len[n] for n in chosen]
+    sequences = [InitialModel.sequence[n] for n in chosen]
+    assert InitialModel.create_model(names, lengths, sequences)
+    model = libsbml.readSBMLFromFile(str(tmp_path / 'model1.xml')).getModel()
+    for name, length in zip(names, lengths):
+        assert model.getSpecies(name + '_p' + str(int(length) - 1)) is not None
@@ -0,0 +1,37 @@
+import numpy as np
+import scipy.sparse as sp
+
+import hybrid
+import nextReaction
+import tauLeaping
+from network import Network
+
+
+def starving_network():
+    # 2 A -> B under the linear law k * A, and B -> 0 under the constant
+    # law k: neither law stops its reaction when the reactants run out
+    stoichiometry = sp.csc_matrix(np.array([[-2, 0], [1, -1]]))
+    return Network(['A', 'B'], [5, 0], ['pair', 'decay'], stoichiometry, [1.0, 10.0],
+                   [0, 1, 1], [0])
+
+
+def test_propensities_are_gated_on_reactants():
+    network = starving_network()
+    assert network.propensities([1, 0]).tolist() == [0.0, 0.0]
+    assert network.propensities([2, 1]).tolist() == [2.0, 10.0]
+    assert network.propensities([1, 0], gated=False).tolist() == [1.0, 10.0]
+
+
+def test_gates_list_consumed_species_that_are_not_factors():
+    gates = starving_network().gates()
+    # A is a factor of 'pair'; B only gates 'decay'
+    assert gates == [None, ([1], [1])]
+
+
+def test_counts_stay_non_negative():
+    for simulator in (nextReaction.NextReactionSimulator, tauLeaping.TauLeapingSimulator,
+                      hybrid.HybridSimulator):
+        for seed in range(5):
+            times, counts = simulator(starving_network(), seed=seed).run(5.0, dt=0.1)
+            assert counts.min() >= 0, simulator.__name__
+            assert counts[-1].tolist() == [1, 0], simulator.__name__
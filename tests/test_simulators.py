@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+import hybrid
+import network
+import nextReaction
+import ode
+import tauLeaping
+from network import Network
+
+REPLICATES = 40
+
+
+def binding_network():
+    # A + B <-> C from 1000 A and 1000 B: about 382 C at equilibrium
+    stoichiometry = sp.csc_matrix(np.array([[-1, 1], [-1, 1], [1, -1]]))
+    return Network(['A', 'B', 'C'], [1000, 1000, 0], ['bind', 'unbind'], stoichiometry, [1e-3, 1.0],
+                   [0, 2, 3], [0, 1, 2])
+
+
+def mean_count(make, t_end=5.0):
+    # mean of C at t_end over REPLICATES seeds
+    return np.mean([make(seed).run(t_end, observe=['C'])[1][-1, 0] for seed in range(REPLICATES)])
+
+
+def test_simulators_agree_on_binding():
+    net = binding_network()
+    expected = ode.OdeSimulator(net).run(5.0, observe=['C'])[1][-1, 0]
+    assert expected == pytest.approx(382.0, abs=1.0)
+    # hybrid: C becomes continuous above 100 copies on the way
+    means = {'nextReaction': mean_count(lambda seed: nextReaction.NextReactionSimulator(net, seed=seed)),
+             'tauLeaping': mean_count(lambda seed: tauLeaping.TauLeapingSimulator(net, seed=seed)),
+             'hybrid': mean_count(lambda seed: hybrid.HybridSimulator(net, seed=seed, threshold=100))}
+    for method, mean in means.items():
+        assert mean == pytest.approx(expected, abs=8.0), method
+
+
+def test_generated_model_counts_stay_non_negative():
+    pytest.importorskip('libsbml')
+    generator = network._generator('TranslationSBMLgenerator')
+    net = network.translation_network(list(generator.prot_names[:3]), generator.prot_len[:3],
+                                      generator.sequence[:3], buffered=network.METABOLITES)
+    x0 = net.x0.copy()
+    for i, name in enumerate(net.species):
+        if name.startswith('aminoacylated_'):
+            x0[i] = 5
+        elif name in ('RIBOSOME_30S_IF3', 'RIBOSOME_50S', 'MG_258_MONOMER'):
+            x0[i] = 3
+    for simulator in (nextReaction.NextReactionSimulator, tauLeaping.TauLeapingSimulator,
+                      hybrid.HybridSimulator):
+        times, counts = simulator(net, seed=1, x0=x0).run(20, dt=1)
+        assert counts.min() >= 0, simulator.__name__
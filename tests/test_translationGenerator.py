@@ -0,0 +1,22 @@
+import filecmp
+
+import pytest
+
+pytest.importorskip('libsbml')
+
+import network
+
+MODES = {'stream': dict(stream=True), 'processes': dict(processes=2), 'cache': dict(cache_dir='cache')}
+
+
+def test_create_model_modes_write_the_same_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generator = network._generator('TranslationSBMLgenerator')
+    args = (list(generator.prot_names[:3]), generator.prot_len[:3], generator.sequence[:3])
+    generator.create_model(*args, filename='memory.xml')
+    for mode, options in sorted(MODES.items()):
+        generator.create_model(*args, filename=mode + '.xml', **options)
+        assert filecmp.cmp('memory.xml', mode + '.xml', shallow=False), mode
+    # again, from the cache
+    generator.create_model(*args, filename='cached.xml', cache_dir='cache')
+    assert filecmp.cmp('memory.xml', 'cached.xml', shallow=False)